@@ -15,6 +15,9 @@ LOCAL_IP = '127.0.0.1'
 # Defualt data received buffer size:
 BUFFER_SIZE = 1024
 
+# Asyncio sign server listen backlog(max number of not accepted connections).
+AIO_BACKLOG = 128
+
 # Data message dump and load tag
 CMD_TYPE = 'C'.encode('utf-8')  # cmd type message used for contorl.
 FILE_TYPE = 'F'.encode('utf-8') # file(bytes) type.
@@ -23,4 +26,59 @@ FILE_TYPE = 'F'.encode('utf-8') # file(bytes) type.
 RAN_LEN = 4 # The random number/bytes length.
 
 # SWA_TT setting:
-SWATT_ITER  = 300 # Swatt calculation iteration count.
\ No newline at end of file
+SWATT_ITER  = 300 # Swatt calculation iteration count.
+SWATT_WORKERS = 4 # SWATT verification worker process count.
+SWATT_TIMEOUT = 10 # max seconds to wait for one SWATT verification job.
+SWATT_DIGEST = 0 # SWATT digest version: 0-legacy hex(hash()), 1-stable 'v1:' hex.
+
+# SWA_TT challenge pool setting:
+CHALL_LEN = 10  # SWATT challenge string length.
+CHALL_POOL_SIZE = 32    # precomputed challenge count of each (image, PUFF).
+CHALL_POOL_TARGETS = 16 # max (image, PUFF) targets number.
+
+# Sign session setting:
+SESSION_TIMEOUT = 600 # seconds a sign session can be idle before evicted.
+SESSION_MAX = 1024  # max active sign session number.
+
+# Sign server request handler pool setting:
+SERV_WORKERS = 8 # handler threads number, each serves one connection.
+SERV_QUEUE = 8  # accepted connections can wait for a free handler thread.
+SERV_REQ_WORKERS = 16 # threads to run the in-flight sign requests.
+SERV_INFLIGHT = 8 # max in-flight sign requests of one connection.
+SERV_REJECT_WORKERS = 8 # threads to reply the rejected connections.
+SERV_REJECT_MAX = 64 # max rejected connections waiting for the reply.
+SERV_REJECT_TIMEOUT = 2 # max seconds to reply a rejected connection.
+
+# Key store setting:
+KEY_CHECK_INTERVAL = 1 # min seconds between the PEM file change checks.
+
+# Sign batch setting:
+SIGN_BATCH_WINDOW = 0.02 # seconds to collect the sign records of one batch.
+SIGN_BATCH_SIZE = 32 # max sign records number of one batch.
+SIGN_BATCH_TIMEOUT = 5 # max seconds to wait for a record to be signed.
+SIGN_BULK_MAX = 1000 # max sign entries of one bulk sign(SB) request.
+
+# Message frame setting:
+FRAME_RECV_SIZE = 16*1024 # max bytes of one socket recv() of the frame reader.
+FRAME_MAX_SIZE = 4*1024*1024 # max payload bytes of one message frame.
+
+# Sensor registration server setting:
+RG_BACKLOG = 128 # listen backlog of the registration server.
+RG_TIMEOUT = 30 # seconds a registration connection can be idle before closed.
+
+# Server life cycle setting:
+SERV_DRAIN_TIMEOUT = 30 # max seconds to wait for the in-flight sessions when stop.
+
+# Data base setting:
+DB_BUSY_TIMEOUT = 5 # seconds a connection waits for the other writer.
+DB_CACHE_KB = 4096 # page cache KB of each data base connection.
+DB_MMAP_SIZE = 64*1024*1024 # bytes of the data base file mapped to memory.
+DB_BULK_CHUNK = 5000 # records of one bulk import transaction/export fetch.
+
+# Authorized sensor cache setting:
+SENSOR_CACHE_SIZE = 65536 # max cached sensor signatures.
+SENSOR_CACHE_TTL = 300 # seconds a cached sensor signature is valid.
+
+# User credential cache setting:
+USER_CACHE_SIZE = 1024 # max cached user credentials.
+USER_CACHE_TTL = 600 # seconds a cached user credential is valid.
\ No newline at end of file
@@ -13,9 +13,33 @@
 import os
 import random
 import string
+import threading
+from array import array
+from collections import OrderedDict
+from firmwImgMgr import firmwImgMgr
+try:
+    import numpy as np # only needed by the vectorized SWATT engine.
+except ImportError:
+    np = None
 RAN_FLAG = True #Flag to decide wehter we ues Linear congruential generator(BSD)
 DE_PUFF = 154946511204680
 
+# Linear congruential generator(BSD) parameters and the SWATT address range.
+LCG_A = 1103515245
+LCG_C = 12345
+LCG_MASK = 0x7fffffff
+ADDR_RANGE = 128000
+CHUNK_SIZE = 64*1024    # image bytes per walk round of the full image SWATT.
+
+KSA_CACHE_SIZE = 256    # max number of (challenge, m) KSA states we cache.
+
+# SWATT digest(output) version:
+DIGEST_LEGACY = 0   # hex(hash(checksum)), depends on the interpreter's hash.
+DIGEST_V1 = 1       # 'v1:'+ fixed width(16 digits) hex of the checksum.
+
+# Firmware image registry shared by all the SWATT calculators in the process.
+IMG_MGR = firmwImgMgr()
+
 # -----------------------------------------------------------------------------
 # Linear congruential generator(BSD) 
 def bsd_rand(seed):
@@ -26,6 +50,80 @@ def bsd_rand(seed):
     rand.seed = seed
     return rand
 
+# -----------------------------------------------------------------------------
+# SWATT walk address generator(closed form of the bsd_rand address)
+def swattAddrBase(state, iterNum):
+    """ Precompute the challenge dependent part of all the SWATT walk address:
+        bsd_rand((RC4i<<8)+c[j-1])() = (base[i] + A*c[j-1]) & MASK, where 
+        base[i] = (A*(RC4i<<8)+C) & MASK. state can be a KSA state list(return
+        a list) or a uint64 array with the state in the last axis(return array).
+    """
+    if np is not None and isinstance(state, np.ndarray):
+        return ((state[..., :iterNum] << np.uint64(8))*np.uint64(LCG_A) + np.uint64(LCG_C)) & np.uint64(LCG_MASK)
+    return [(LCG_A*(rc4 << 8) + LCG_C) & LCG_MASK for rc4 in state[:iterNum]]
+
+def swattAddr(base, prevCs):
+    """ Address of one SWATT walk step: same as bsd_rand((RC4i<<8)+prevCs)() % 
+        ADDR_RANGE+1, also works on the uint64 arrays of a walk batch.
+    """
+    return ((base + LCG_A*(prevCs & LCG_MASK)) & LCG_MASK) % ADDR_RANGE+1
+
+# -----------------------------------------------------------------------------
+def swattDigest(checksum, digestVer=DIGEST_LEGACY):
+    """ Convert the final SWATT checksum to the digest string of the version."""
+    if digestVer == DIGEST_V1:
+        return 'v1:%016x' % checksum
+    return hex(hash(checksum))
+
+def digestValue(digest):
+    """ Convert the digest string of any version back to a int."""
+    return int(digest[3:], 16) if digest.startswith('v1:') else int(digest, 0)
+
+# -----------------------------------------------------------------------------
+# -----------------------------------------------------------------------------
+class ksaCache(object):
+    """ Bounded LRU cache of the RC4 KSA state keyed by (challenge, m). The 
+        state is saved as a compact array('H') (array('L') if m is bigger 
+        than 65536) and must be used as read only.
+    """
+    def __init__(self, maxSize=KSA_CACHE_SIZE):
+        self.maxSize = maxSize
+        self.states = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = self.misses = 0
+
+#--ksaCache--------------------------------------------------------------------
+    def get(self, challengeStr, m):
+        """ Return the cached state or None if not found."""
+        with self.lock:
+            state = self.states.get((challengeStr, m))
+            if state is None:
+                self.misses += 1
+                return None
+            self.states.move_to_end((challengeStr, m))
+            self.hits += 1
+            return state
+
+#--ksaCache--------------------------------------------------------------------
+    def put(self, challengeStr, m, state):
+        """ Save the state list and return the compact array copy."""
+        state = array('H' if m <= 0x10000 else 'L', state)
+        with self.lock:
+            self.states[(challengeStr, m)] = state
+            self.states.move_to_end((challengeStr, m))
+            while len(self.states) > self.maxSize:
+                self.states.popitem(last=False)
+        return state
+
+#--ksaCache--------------------------------------------------------------------
+    def getStats(self):
+        """ Return the cache (hits, misses, size)."""
+        with self.lock:
+            return (self.hits, self.misses, len(self.states))
+
+# KSA state cache shared by all the SWATT calculators in the process.
+KSA_CACHE = ksaCache()
+
 # -----------------------------------------------------------------------------
 # -----------------------------------------------------------------------------
 class swattCal(object):
@@ -33,10 +131,23 @@ class swattCal(object):
         swatt value.
     """
 # --swattCal-------------------------------------------------------------------
-    def __init__(self):
+    def __init__(self, vectorized=False, imgMgr=None, ksaCache=None, digestVer=DIGEST_LEGACY):
+        """ Init the calculator, set vectorized=True to use the NumPy engine.
+            The firmware images and KSA states are read from the shared 
+            IMG_MGR and KSA_CACHE by default. digestVer selects the format of
+            the returned SWATT value (DIGEST_V1 is stable across processes and
+            machines, DIGEST_LEGACY is kept for the old clients).
+        """
+        self.digestVer = digestVer
+        self.imgMgr = imgMgr if imgMgr else IMG_MGR
+        self.ksaCache = ksaCache if ksaCache else KSA_CACHE
         self.state = None
         self.puffVal = DE_PUFF  # DEFAULT PUFF VALUE FOR EACH DEVICE
         self.iterM = 0  # swatt iteration time.
+        self.vectorized = vectorized
+        if vectorized and np is None:
+            print("SWATT: numpy is not installed, use the python engine.")
+            self.vectorized = False
 
 # --swattCal-------------------------------------------------------------------
     def bitExtracted(self, number, k, s):
@@ -69,6 +180,17 @@ class swattCal(object):
             j = (j + self.state[i] + key[i % len(key)]) % m
             self.state[i], self.state[j] = self.state[j], self.state[i]
 
+# --swattCal-------------------------------------------------------------------
+    def loadKey(self, challengeStr, m):
+        """ Set the KSA state of the challenge string from the KSA cache, the 
+            state will be calculated by setKey() if it is not cached.
+        """
+        state = self.ksaCache.get(challengeStr, m)
+        if state is None:
+            self.setKey(self.string_to_list(challengeStr), m)
+            state = self.ksaCache.put(challengeStr, m, self.state)
+        self.state = state
+
 # --swattCal-------------------------------------------------------------------
     def setPuff(self, puff):
         """ Set the PUFF seed value. puff must be a int."""
@@ -93,55 +215,186 @@ class swattCal(object):
         """ Calculate the file swatt value based on the input challenge string
             and the iterative count. 
         """
-        if not os.path.exists(filePath):
+        mem = self.imgMgr.getImage(filePath)
+        if mem is None:
             print("The file <%s> is not exist." % filePath)
             return None
-        with open(filePath, "rb") as fh:
-            self.setKey(self.string_to_list(challengeStr), m)
-            cr_response = self.extract_CRpair(challengeStr)  # P(C)
-            #init_cs = cr_response ^ m  # sigma(0)<--p(c) xor x0
-            #pprev_cs = self.state[256]  # c[(j-2)mod 8]
-            #prev_cs = self.state[257]  # c[(j-1)mod 8]
-            #current_cs = self.state[258]  # c[j]
-            pprev_cs, prev_cs, current_cs = self.state[256:259]
-            init_seed = m  # set x(i-1)
-            # print init_cs.bit_length(),bin(init_cs),init_cs
-            iterNum = self.iterM if self.iterM > 0 else m
-            for i in range(iterNum):
-                swatt_seed = cr_response ^ init_seed  # y(i-1)=p(c) xor x(i-1)
+        if self.vectorized and RAN_FLAG:
+            return self._getSWATTnp(challengeStr, m, mem)
+        self.loadKey(challengeStr, m)
+        cr_response = self.extract_CRpair(challengeStr)  # P(C)
+        #init_cs = cr_response ^ m  # sigma(0)<--p(c) xor x0
+        #pprev_cs = self.state[256]  # c[(j-2)mod 8]
+        #prev_cs = self.state[257]  # c[(j-1)mod 8]
+        #current_cs = self.state[258]  # c[j]
+        pprev_cs, prev_cs, current_cs = self.state[256:259]
+        init_seed = m  # set x(i-1)
+        # print init_cs.bit_length(),bin(init_cs),init_cs
+        iterNum = self.iterM if self.iterM > 0 else m
+        addrBase = swattAddrBase(self.state, iterNum) if RAN_FLAG else None
+        for i in range(iterNum):
+            swatt_seed = cr_response ^ init_seed  # y(i-1)=p(c) xor x(i-1)
+            #use python PRG to generate address Range
+            if RAN_FLAG:
+                # bsd_rand((RC4i<<8)+c[(j-1)mod 8]) in closed form, inline of
+                # swattAddr() as it is the hot path.
+                Address = ((addrBase[i] + LCG_A*(prev_cs & LCG_MASK)) & LCG_MASK) % ADDR_RANGE+1
+            else:
                 # (RC4i<<8)+c[(j-1)mod 8]
                 Address = (self.state[i] << 8)+prev_cs
-                #use python PRG to generate address Range
-                if RAN_FLAG:
-                    randGen = bsd_rand(Address)
-                    Address = randGen() % 128000+1
-                else:
-                    random.seed(Address)
-                    # YC: why only check 128000 bytes?
-                    Address = random.randint(1, 128000)
-                # read the EEPROM Memory content
-                fh.seek(Address)
-                strTemp = fh.read(1)
-                # print(Address)
-                #calculate checksum at the location
-                # if not strTemp: continue  # jump over the empty str ""
-                num = ord(strTemp) if len(strTemp) != 0 else 0
-                # current_cs=current_cs+(ord(strTemp[0])^pprev_cs+state[i-1])
-                current_cs = current_cs + (num ^ pprev_cs+self.state[i-1])
-                # extra seed for the SWATT
-                init_seed = current_cs+swatt_seed
-                # update current_cs
-                current_cs = current_cs >> 1
-                # update c[(j-2)mod 8] & c[(j-1)mod 8]
-                pprev_cs = prev_cs
-                prev_cs = current_cs
-            #return current_cs
-            return hex(hash(current_cs))
+                random.seed(Address)
+                # YC: why only check 128000 bytes?
+                Address = random.randint(1, 128000)
+            # read the EEPROM Memory content
+            # print(Address)
+            #calculate checksum at the location
+            # jump over the address after the end of file (read as 0)
+            num = mem[Address] if Address < len(mem) else 0
+            # current_cs=current_cs+(ord(strTemp[0])^pprev_cs+state[i-1])
+            current_cs = current_cs + (num ^ pprev_cs+self.state[i-1])
+            # extra seed for the SWATT
+            init_seed = current_cs+swatt_seed
+            # update current_cs
+            current_cs = current_cs >> 1
+            # update c[(j-2)mod 8] & c[(j-1)mod 8]
+            pprev_cs = prev_cs
+            prev_cs = current_cs
+        #return current_cs
+        return swattDigest(current_cs, self.digestVer)
+
+# --swattCal-------------------------------------------------------------------
+    def _getSWATTnp(self, challengeStr, m, mem):
+        """ NumPy engine of getSWATT() (RAN_FLAG=True only): the firmware image 
+            view is used as a uint8 array and the data independent part of 
+            every BSD rand address is precomputed as array operations. Only the 
+            checksum feedback (c[j-1] is part of the next address seed) is left 
+            in the loop, the result is bit-identical to the python engine.
+        """
+        self.loadKey(challengeStr, m)
+        iterNum = self.iterM if self.iterM > 0 else m
+        if iterNum > m:
+            raise IndexError("SWATT iteration count <%s> is bigger than m <%s>" % (iterNum, m))
+        mem = memoryview(self._imageArray(mem))
+        state = np.array(self.state, dtype=np.uint64)
+        addrBase = swattAddrBase(state, iterNum)
+        statePrev = np.roll(state, 1)[:iterNum] # state[i-1], state[-1] for i=0
+        pprev_cs, prev_cs, current_cs = self.state[256:259]
+        for base, sPrev in zip(addrBase.tolist(), statePrev.tolist()):
+            num = mem[((base + LCG_A*(prev_cs & LCG_MASK)) & LCG_MASK) % ADDR_RANGE+1]
+            current_cs = (current_cs + (num ^ pprev_cs+sPrev)) >> 1
+            pprev_cs, prev_cs = prev_cs, current_cs
+        return swattDigest(current_cs, self.digestVer)
+
+# --swattCal-------------------------------------------------------------------
+    def getSWATTFull(self, challengeStr, m, filePath, chunkSize=CHUNK_SIZE):
+        """ Calculate the swatt value which covers the whole firmware file (
+            getSWATT() only checks the first ADDR_RANGE bytes). The address 
+            range of the walk is the whole image and the walk runs the 
+            iteration count once for every chunkSize bytes of the image, so 
+            the time is linear with the file size. The image is read through 
+            the shared image manager.
+        """
+        mem = self.imgMgr.getImage(filePath)
+        if mem is None:
+            print("The file <%s> is not exist." % filePath)
+            return None
+        self.loadKey(challengeStr, m)
+        iterNum = self.iterM if self.iterM > 0 else m
+        addrBase = swattAddrBase(self.state, iterNum)
+        if len(addrBase) < iterNum:
+            raise IndexError("SWATT iteration count <%s> is bigger than m <%s>" % (iterNum, m))
+        statePrev = [self.state[i-1] for i in range(iterNum)]
+        pprev_cs, prev_cs, current_cs = self.state[256:259]
+        imgSize = len(mem)
+        for _ in range(-(-imgSize // chunkSize)):
+            for base, sPrev in zip(addrBase, statePrev):
+                num = mem[((base + LCG_A*(prev_cs & LCG_MASK)) & LCG_MASK) % imgSize]
+                current_cs = (current_cs + (num ^ pprev_cs+sPrev)) >> 1
+                pprev_cs, prev_cs = prev_cs, current_cs
+        return swattDigest(current_cs, self.digestVer)
+
+# --swattCal-------------------------------------------------------------------
+    def getSWATTBatch(self, challenges, puffs, m, filePath):
+        """ Calculate the swatt value of one file for a batch of challenge 
+            strings and PUFF values in one pass. The image is read once and 
+            the walks of all the distinct (challenge, puff) pairs are computed
+            together (vectorized across the batch), the result list is in the 
+            input order and same as calling setPuff()+getSWATT() one by one.
+        """
+        if len(challenges) != len(puffs):
+            print("SWATT: The challenge and puff list length are different.")
+            return None
+        mem = self.imgMgr.getImage(filePath)
+        if mem is None:
+            print("The file <%s> is not exist." % filePath)
+            return None
+        pairs = list(OrderedDict.fromkeys(zip(challenges, puffs)))
+        if self.vectorized and RAN_FLAG:
+            results = self._getSWATTBatchNp([c for c, _ in pairs], m, mem)
+        else:
+            results = []
+            for challengeStr, puff in pairs:
+                self.setPuff(puff)
+                results.append(self.getSWATT(challengeStr, m, filePath))
+        resultDict = dict(zip(pairs, results))
+        return [resultDict[pair] for pair in zip(challenges, puffs)]
+
+# --swattCal-------------------------------------------------------------------
+    def _getSWATTBatchNp(self, challenges, m, mem):
+        """ NumPy engine of getSWATTBatch(): run the address walks of all the 
+            challenges in lock step, each loop step is one array operation 
+            across the batch dimension.
+        """
+        if not challenges: return []
+        iterNum = self.iterM if self.iterM > 0 else m
+        if iterNum > m:
+            raise IndexError("SWATT iteration count <%s> is bigger than m <%s>" % (iterNum, m))
+        image = self._imageArray(mem)
+        states = []
+        for challengeStr in challenges:
+            self.loadKey(challengeStr, m)
+            states.append(self.state)
+        states = np.array(states, dtype=np.uint64)
+        # One row per loop step, one column per challenge.
+        addrBase = np.ascontiguousarray(swattAddrBase(states, iterNum).T)
+        statePrev = np.ascontiguousarray(np.roll(states, 1, axis=1)[:, :iterNum].T)
+        pprev_cs, prev_cs, current_cs = states[:, 256], states[:, 257], states[:, 258]
+        one = np.uint64(1)
+        for base, sPrev in zip(addrBase, statePrev):
+            current_cs = (current_cs + (image[swattAddr(base, prev_cs)] ^ (pprev_cs+sPrev))) >> one
+            pprev_cs, prev_cs = prev_cs, current_cs
+        return [swattDigest(cs, self.digestVer) for cs in current_cs.tolist()]
+
+# --swattCal-------------------------------------------------------------------
+    def _imageArray(self, mem):
+        """ Return the image view as a uint8 array which can be indexed by all 
+            the address 0..ADDR_RANGE (bytes after the end of file are 0).
+        """
+        if len(mem) > ADDR_RANGE:
+            return np.frombuffer(mem, dtype=np.uint8)
+        image = np.zeros(ADDR_RANGE+1, dtype=np.uint8)
+        image[:len(mem)] = np.frombuffer(mem, dtype=np.uint8)
+        return image
 
 # -----------------------------------------------------------------------------
 # Lib function test case(we will do this in the future.)
 def testCase():
     firmwarePath = "".join([os.getcwd(), "\\firmwSign\\firmwareSample"])
+    print("Start address generator test.")
+    state = [random.randint(0, 0xffff) for _ in range(300)]
+    prevList = [random.randint(0, 1 << 80) for _ in range(300)]
+    addrList = [bsd_rand((rc4 << 8)+prev)() % 128000+1 for rc4, prev in zip(state, prevList)]
+    if addrList == [swattAddr(base, prev) for base, prev in zip(swattAddrBase(state, 300), prevList)]:
+        print("SWATT address generator test pass.")
+    else:
+        print("SWATT address generator test fail.")
+    if np is not None:
+        prevArr = np.array([prev & 0xffffffff for prev in prevList], dtype=np.uint64)
+        addrArr = swattAddr(swattAddrBase(np.array(state, dtype=np.uint64), 300), prevArr)
+        if addrArr.tolist() == [bsd_rand((rc4 << 8)+int(prev))() % 128000+1 for rc4, prev in zip(state, prevArr)]:
+            print("SWATT address generator array test pass.")
+        else:
+            print("SWATT address generator array test fail.")
     calculator = swattCal()
     print("Start test.")
     puffVal = DE_PUFF
@@ -150,12 +403,52 @@ def testCase():
     print(result)
     if result == '0x397d' and not RAN_FLAG:
         print("SWATT calcualtion test pass.(use defualt random)")
-        return
     elif result == '0x3b0d' and  RAN_FLAG:
         print("SWATT calcualtion test pass.(use Linear congruential generator random)")
-        return
     else:
         print("SWATT calculation test fail.")
+    if np is None or not RAN_FLAG: return
+    print("Start vectorized engine test.")
+    calculator = swattCal(vectorized=True)
+    calculator.setPuff(puffVal)
+    if calculator.getSWATT("Testing", 300, firmwarePath) == result:
+        print("SWATT vectorized engine test pass.")
+    else:
+        print("SWATT vectorized engine test fail.")
+    results = calculator.getSWATTBatch(["Testing", "Batch", "Testing"], [puffVal]*3, 300, firmwarePath)
+    if results[0] == results[2] == result and results[1] == swattCal().getSWATT("Batch", 300, firmwarePath):
+        print("SWATT batch test pass.")
+    else:
+        print("SWATT batch test fail.")
+    if calculator.getSWATTBatch([], [], 300, firmwarePath) == swattCal().getSWATTBatch([], [], 300, firmwarePath) == []:
+        print("SWATT empty batch test pass.")
+    else:
+        print("SWATT empty batch test fail.")
+    calculator = swattCal(digestVer=DIGEST_V1)
+    digest = calculator.getSWATT("Testing", 300, firmwarePath)
+    if digest == 'v1:0000000000003b0d' and digestValue(digest) == digestValue(result):
+        print("SWATT digest v1 test pass.")
+    else:
+        print("SWATT digest v1 test fail.")
+    fullResult = calculator.getSWATTFull("Testing", 300, firmwarePath)
+    if fullResult and fullResult == calculator.getSWATTFull("Testing", 300, firmwarePath, chunkSize=CHUNK_SIZE) \
+        and fullResult != calculator.getSWATTFull("Testing", 300, firmwarePath, chunkSize=CHUNK_SIZE//2):
+        print("SWATT full image test pass.")
+    else:
+        print("SWATT full image test fail.")
+    # The walk reads the whole image: change the bytes after the first chunk.
+    import tempfile
+    with open(firmwarePath, 'rb') as fh:
+        data = fh.read()
+    with tempfile.TemporaryDirectory() as tmpDir:
+        tailPath = os.path.join(tmpDir, 'firmwareTail')
+        with open(tailPath, 'wb') as fh:
+            fh.write(data[:CHUNK_SIZE] + bytes(b ^ 0xff for b in data[CHUNK_SIZE:]))
+        tailResult = calculator.getSWATTFull("Testing", 300, tailPath)
+    if len(data) > CHUNK_SIZE and tailResult != fullResult:
+        print("SWATT full image address range test pass.")
+    else:
+        print("SWATT full image address range test fail.")
 
 if __name__ == '__main__':
     testCase()
@@ -23,7 +23,6 @@ import threading
 
 from struct import unpack
 from functools import partial
-from Constants import BUFFER_SIZE
 
 import firmwMsgMgr
 import firmwTLSclient as SSLC
@@ -101,7 +100,7 @@ class SensorReaderFrame(wx.Frame):
         # Init the SSL client to TLS connection.
         self.sslClient = SSLC.TLS_sslClient(self)  # changed to ssl client.
         # Init the message manager.
-        self.msgMgr = firmwMsgMgr.msgMgr(self)  # create the message manager.
+        self.msgMgr = firmwMsgMgr.msgMgr(self, framing=True)  # create the message manager.
         # Init the serial reader
         #self.ser = serial.Serial('/dev/ttyUSB0', 115200, 8, 'N', 1, timeout=1)
         self.setSerialComm(searchFlag=True)
@@ -155,9 +154,10 @@ class SensorReaderFrame(wx.Frame):
             self.serverchoice.GetSelection())
             ip, port = gv.RG_SERVER_CHOICE[ServerName]
             self.sslClient.connect((ip, port))
+            reader = firmwMsgMgr.frameReader(self.sslClient.recv)
             # send connect request cmd.
             self.sslClient.send(self.msgMgr.dumpMsg(action='CR'))
-            dataDict = self.msgMgr.loadMsg(self.sslClient.recv(BUFFER_SIZE))
+            dataDict = self.msgMgr.loadMsg(reader.readFrame())
             if dataDict['act'] == 'HB' and dataDict['lAct'] == 'CR' and dataDict['state']:
                 print("SConnetion: Connect to the server succesfully.")
             else:
@@ -169,7 +169,7 @@ class SensorReaderFrame(wx.Frame):
             
             data = (self.senId, self.sensorType, self.version, self.signature)
             self.sslClient.send(self.msgMgr.dumpMsg(action='RG', dataArgs=data))
-            dataDict = self.msgMgr.loadMsg(self.sslClient.recv(BUFFER_SIZE))
+            dataDict = self.msgMgr.loadMsg(reader.readFrame())
             if dataDict['act'] == 'HB' and dataDict['lAct'] == 'RG' and dataDict['state']:
                 #print("FirmwSign: The sensor is registered successfully.")
                 self.statusbar.SetStatusText("Sensor registration done.")
@@ -24,7 +24,6 @@ import random
 
 from struct import unpack
 from functools import partial
-from Constants import BUFFER_SIZE
 
 import firmwMsgMgr
 import firmwTLSclient as SSLC
@@ -60,7 +59,7 @@ class SensorReaderFrame(wx.Frame):
         # Init the SSL client to TLS connection.
         self.sslClient = SSLC.TLS_sslClient(self)  # ssl client to send the sensor signature.
         # Init the message manager.
-        self.msgMgr = firmwMsgMgr.msgMgr(self)  # create the message manager.
+        self.msgMgr = firmwMsgMgr.msgMgr(self, framing=True)  # create the message manager.
         # Init the serial reader
         self.setSerialComm(searchFlag=True)
         # Init the recall future.
@@ -105,9 +104,10 @@ class SensorReaderFrame(wx.Frame):
             # Connect to the selected server. 
             ip, port = gv.RG_SERVER_CHOICE[ServerName]
             self.sslClient.connect((ip, port))
+            reader = firmwMsgMgr.frameReader(self.sslClient.recv)
             # Send SSL connection request cmd and get response.
             self.sslClient.send(self.msgMgr.dumpMsg(action='CR'))
-            dataDict = self.msgMgr.loadMsg(self.sslClient.recv(BUFFER_SIZE))
+            dataDict = self.msgMgr.loadMsg(reader.readFrame())
             if dataDict['act'] == 'HB' and dataDict['lAct'] == 'CR' and dataDict['state']:
                 print("SConnetion: Connect to the server succesfully.")
             else:
@@ -117,7 +117,7 @@ class SensorReaderFrame(wx.Frame):
             # Register the sensor.(Temporary hard code the sigature for test.)
             data = (self.senId, SENSOR_TYPE, self.version, self.signature)
             self.sslClient.send(self.msgMgr.dumpMsg(action='RG', dataArgs=data))
-            dataDict = self.msgMgr.loadMsg(self.sslClient.recv(BUFFER_SIZE))
+            dataDict = self.msgMgr.loadMsg(reader.readFrame())
             if dataDict['act'] == 'HB' and dataDict['lAct'] == 'RG' and dataDict['state']:
                 self.statusbar.SetStatusText("Sensor registration success.")
                 self.activeFlag = True
@@ -0,0 +1,204 @@
+#!/usr/bin/python
+#-----------------------------------------------------------------------------
+# Name:        firmwAioServer.py
+#
+# Purpose:     This module is used to create an asyncio based TLS server for
+#              the firmware sign protocol (CR/LI1/LI2/CF/SR/LO). Every client
+#              connection is served by its own coroutine with its own session
+#              object, so many signers can be served at the same time, and the
+#              sign requests of a connection can be pipelined. The message
+#              handling is done by the FirmwServ handle*() functions which run
+#              in the executor threads(never block the event loop).
+# Author:      Yuancheng Liu
+#
+# Created:     2019/10/11
+# Copyright:   NUS – Singtel Cyber Security Research & Development Laboratory
+# License:     YC @ NUS
+#-----------------------------------------------------------------------------
+import os
+import ssl
+import socket
+import asyncio
+import firmwMsgMgr
+import firmwGlobal as gv
+from functools import partial
+from Constants import SWATT_ITER, AIO_BACKLOG, SERV_INFLIGHT, SERV_DRAIN_TIMEOUT
+from Constants import SESSION_TIMEOUT
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class aioSender(object):
+    """ Give the asyncio stream writer the send() function the handlers use,
+        the handlers running in the executor threads can also call it.
+    """
+    def __init__(self, writer, loop):
+        self.writer = writer
+        self.loop = loop
+
+    def send(self, data):
+        if not data: return
+        try:
+            asyncio.get_running_loop()
+            self.writer.write(data)
+        except RuntimeError:
+            self.loop.call_soon_threadsafe(self.writer.write, data)
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class firmwAioServer(object):
+    """ Asyncio firmware sign server, parent is the FirmwServ which provides
+        the msgMgr, swattPool and the message handlers.
+    """
+    def __init__(self, parent, port=gv.SITCP_PORT, backlog=AIO_BACKLOG, fd=None):
+        self.parent = parent
+        self.port = port
+        self.backlog = backlog
+        self.sslCtx = self._initSSLContext()
+        self.sock = self._initSocket(fd)
+        self.server = None
+        self.loop = None
+        self.stopEvent = None   # set to stop accepting and drain the clients.
+        self.drainTimeout = SERV_DRAIN_TIMEOUT
+        self.clients = {}       # client task -> stream writer.
+
+#--firmwAioServer--------------------------------------------------------------
+    def _initSSLContext(self):
+        """ Load the CA + certificate + private key, demand client certificate."""
+        ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        ctx.verify_mode = ssl.CERT_REQUIRED
+        ctx.load_cert_chain(gv.SSSL_CERT_PATH, gv.SSSL_PRIK_PATH)
+        ctx.load_verify_locations(gv.CA_PATH)
+        return ctx
+
+#--firmwAioServer--------------------------------------------------------------
+    def _initSocket(self, fd):
+        """ Create the listening socket, use the inherited one if fd is given
+            (hot restart).
+        """
+        if fd is not None: return socket.socket(fileno=fd)
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        if os.name != 'nt':
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(('', int(self.port)))
+        sock.listen(self.backlog)
+        return sock
+
+#--firmwAioServer--------------------------------------------------------------
+    async def handleClient(self, reader, writer):
+        """ Serve one client connection until it logout or disconnect. The sign
+            requests(SR) run in flight and reply out of order, the other
+            requests wait for the in-flight sign requests.
+        """
+        addr = writer.get_extra_info('peername')
+        print('AioConnection: connection address:<%s>' % str(addr))
+        loop = asyncio.get_running_loop()
+        parent, sender, inflight = self.parent, aioSender(writer, loop), set()
+        session = parent.sessions.create(
+            addr, closeConn=lambda: loop.call_soon_threadsafe(writer.transport.abort))
+        if session is None:
+            writer.close()
+            return
+        self.clients[asyncio.current_task()] = writer
+        try:
+            while True:
+                try:
+                    data = await asyncio.wait_for(firmwMsgMgr.readFrameAsync(reader), SESSION_TIMEOUT)
+                except asyncio.TimeoutError:
+                    print("AioConnection: session <%s> idle time out." % str(session.sid))
+                    break
+                if not data: break # get the ending message.
+                if not parent.sessions.touch(session):
+                    print("AioConnection: session <%s> idle time out." % str(session.sid))
+                    break
+                dataDict = parent.msgMgr.loadMsg(data)
+                act = dataDict['act']
+                handler = parent.handlers.get(act)
+                if handler is None: continue
+                if act in ('SR', 'SB'):
+                    if len(inflight) >= SERV_INFLIGHT:
+                        await asyncio.wait(inflight, return_when=asyncio.FIRST_COMPLETED)
+                    task = asyncio.ensure_future(self.handleSignReq(sender, dataDict, session))
+                    inflight.add(task)
+                    task.add_done_callback(inflight.discard)
+                    continue
+                if inflight: await asyncio.wait(inflight)
+                # The handlers use the data base/sha256/pool locks, run them in
+                # a thread so they don't block the other connections. Their
+                # replies are written before the executor result is returned.
+                await loop.run_in_executor(None, handler, sender, dataDict, session)
+                if act == 'LO': break
+                await writer.drain()
+            if inflight: await asyncio.wait(inflight)
+        except Exception as e:
+            print("AioConnection: connection error, exception: <%s>." % str(e))
+        finally:
+            for task in inflight: task.cancel()
+            self.clients.pop(asyncio.current_task(), None)
+            parent.sessions.remove(session)
+            writer.close()
+
+#--firmwAioServer--------------------------------------------------------------
+    async def handleSignReq(self, sender, dataDict, session):
+        """ Handle one in-flight sign(SR) or bulk sign(SB) request."""
+        parent, rid, act = self.parent, dataDict.get('rid'), dataDict['act']
+        loop = asyncio.get_running_loop()
+        try:
+            if act == 'SB':
+                # The bulk sign handler calculates the SWATT in batch, the
+                # sign records wait for their batch, run it in a thread.
+                await loop.run_in_executor(None, parent.handlers[act], sender, dataDict, session)
+            else:
+                # Calculate the expected SWATT in the worker pool without
+                # blocking the other connections, keep it local as the other
+                # in-flight requests of the session may use another PUFF.
+                puff = int(dataDict['sid'])
+                responseEpc = session.getExpect(puff)
+                if responseEpc is None:
+                    responseEpc = await parent.swattPool.getSWATTAsync(
+                        session.ranStr, puff, SWATT_ITER, gv.DEFUALT_FW)
+                    session.setExpect(puff, responseEpc)
+                if responseEpc is None:
+                    sender.send(parent.msgMgr.dumpMsg(action='HB', dataArgs=('SR', 0), rid=rid))
+                else:
+                    await loop.run_in_executor(None, partial(
+                        parent.handleSignResp, sender, dataDict, session, responseEpc=responseEpc))
+            await sender.writer.drain()
+        except Exception as e:
+            print("AioConnection: sign request error, exception: <%s>." % str(e))
+            sender.send(parent.msgMgr.dumpMsg(action='HB', dataArgs=(act, 0), rid=rid))
+
+#--firmwAioServer--------------------------------------------------------------
+    async def serve(self):
+        """ Start the server and serve until requestStop() is called, then
+            stop accepting and wait for the clients until the drain timeout.
+        """
+        self.loop = asyncio.get_running_loop()
+        self.stopEvent = asyncio.Event()
+        self.server = await asyncio.start_server(
+            self.handleClient, sock=self.sock, ssl=self.sslCtx)
+        print("AioServer: listen on port <%s>." % str(self.port))
+        while not self.stopEvent.is_set():
+            # Close the idle sessions every second.
+            self.parent.sessions.evictIdle()
+            try:
+                await asyncio.wait_for(self.stopEvent.wait(), 1)
+            except asyncio.TimeoutError:
+                pass
+        self.server.close()
+        tasks = list(self.clients)
+        print("AioServer: draining <%s> connections." % str(len(tasks)))
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=self.drainTimeout)
+            for task in pending:
+                print("AioServer: close the unfinished connection.")
+                self.clients[task].transport.abort()
+            if pending: await asyncio.wait(pending)
+        await self.server.wait_closed()
+        self.loop = None
+
+#--firmwAioServer--------------------------------------------------------------
+    def requestStop(self, timeout=SERV_DRAIN_TIMEOUT):
+        """ Stop serving(can be called by any thread or the signal handler)."""
+        self.drainTimeout = timeout
+        loop = self.loop
+        if loop and not loop.is_closed(): loop.call_soon_threadsafe(self.stopEvent.set)
@@ -0,0 +1,140 @@
+#!/usr/bin/python
+#-----------------------------------------------------------------------------
+# Name:        firmwChallPool.py
+#
+# Purpose:     This module is used to create a SWATT challenge pool which pre-
+#              generates the SWATT challenge strings for every registered
+#              (firmware image, PUFF) target and calculates their expected
+#              response in the background, so the sign server can pop a ready
+#              (challenge, response) pair when the user login.
+# Author:      Yuancheng Liu
+#
+# Created:     2019/10/09
+# Copyright:   NUS – Singtel Cyber Security Research & Development Laboratory
+# License:     YC @ NUS
+#-----------------------------------------------------------------------------
+import os
+import threading
+from collections import deque
+import IOT_Att as SWATT
+from Constants import SWATT_ITER, CHALL_LEN, CHALL_POOL_SIZE, CHALL_POOL_TARGETS
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class swattChallPool(threading.Thread):
+    """ Thread to keep CHALL_POOL_SIZE precomputed (challenge, response) pairs
+        for each registered (firmware image, PUFF) target. Each pair is only
+        given out once and all the pairs of a target will be dropped if the
+        firmware image is changed.
+    """
+    def __init__(self, swattPool, m=SWATT_ITER, poolSize=CHALL_POOL_SIZE,
+                 maxTargets=CHALL_POOL_TARGETS, challLen=CHALL_LEN):
+        threading.Thread.__init__(self)
+        self.name = "SWATT_challenge_pool"
+        self.daemon = True
+        self.swattPool = swattPool  # SWATT worker pool to calculate the response.
+        self.m = m
+        self.poolSize = poolSize
+        self.maxTargets = maxTargets
+        self.challLen = challLen
+        self.swattHd = SWATT.swattCal()  # used to create the challenge string.
+        self.targets = {}   # (abspath, puff) -> [imageStamp, deque((challenge, response))]
+        self.lock = threading.Lock()
+        self.refillEvent = threading.Event()
+        self.terminate = False
+
+#--swattChallPool--------------------------------------------------------------
+    def addTarget(self, filePath, puff):
+        """ Register a (firmware image, PUFF) target to keep the pairs for."""
+        key = (os.path.abspath(filePath), puff)
+        with self.lock:
+            if key in self.targets: return True
+            if len(self.targets) >= self.maxTargets:
+                print("ChallPool: The target number reach the limit <%s>." % str(self.maxTargets))
+                return False
+            self.targets[key] = [self._imageStamp(key[0]), deque()]
+        self.refillEvent.set()
+        return True
+
+#--swattChallPool--------------------------------------------------------------
+    def popPair(self, filePath, puff):
+        """ Take out one ready (challenge, response) pair of the target, return
+            None if the target is not registered or no pair is ready.
+        """
+        key = (os.path.abspath(filePath), puff)
+        stamp = self._imageStamp(key[0])
+        with self.lock:
+            target = self.targets.get(key)
+            if target is None: return None
+            if target[0] != stamp:
+                # The firmware changed, all the precomputed response are stale.
+                target[0] = stamp
+                target[1].clear()
+            pair = target[1].popleft() if target[1] else None
+        self.refillEvent.set()
+        return pair
+
+#--swattChallPool--------------------------------------------------------------
+    def getStats(self):
+        """ Return the ready pair count of each target."""
+        with self.lock:
+            return {key: len(target[1]) for key, target in self.targets.items()}
+
+#--swattChallPool--------------------------------------------------------------
+    def run(self):
+        """ Refill the targets whenever pairs are taken out."""
+        while not self.terminate:
+            self.refillEvent.wait()
+            self.refillEvent.clear()
+            if self.terminate: break
+            with self.lock:
+                jobs = [(key, target[0], self.poolSize - len(target[1]))
+                        for key, target in self.targets.items() if len(target[1]) < self.poolSize]
+            for (filePath, puff), stamp, count in jobs:
+                challenges = [self.swattHd.randomChallStr(stringLength=self.challLen) for _ in range(count)]
+                results = self.swattPool.getResult(self.swattPool.submitBatch(
+                    challenges, [puff]*count, self.m, filePath))
+                if not results: continue
+                with self.lock:
+                    target = self.targets.get((filePath, puff))
+                    # Drop the result if the image was changed during calculation.
+                    if target is None or target[0] != stamp: continue
+                    target[1].extend(zip(challenges, results))
+
+#--swattChallPool--------------------------------------------------------------
+    def stop(self):
+        """ Stop the refill thread."""
+        self.terminate = True
+        self.refillEvent.set()
+
+#--swattChallPool--------------------------------------------------------------
+    def _imageStamp(self, filePath):
+        """ Return the file (size, mtime) used to find the changed image."""
+        try:
+            stat = os.stat(filePath)
+            return (stat.st_size, stat.st_mtime_ns)
+        except OSError:
+            return None
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+def testCase():
+    import time
+    import firmwSwattPool as SWPOOL
+    firmwarePath = "".join([os.getcwd(), "\\firmwSign\\firmwareSample"])
+    swattPool = SWPOOL.swattPool(imagePaths=[firmwarePath], workers=2)
+    challPool = swattChallPool(swattPool, poolSize=4)
+    challPool.start()
+    print("Start SWATT challenge pool test.")
+    challPool.addTarget(firmwarePath, SWATT.DE_PUFF)
+    time.sleep(1)
+    pair = challPool.popPair(firmwarePath, SWATT.DE_PUFF)
+    if pair and pair[1] == swattPool.getSWATT(pair[0], SWATT.DE_PUFF, SWATT_ITER, firmwarePath):
+        print("SWATT challenge pool test pass.")
+    else:
+        print("SWATT challenge pool test fail.")
+    challPool.stop()
+    swattPool.shutdown()
+
+if __name__ == '__main__':
+    testCase()
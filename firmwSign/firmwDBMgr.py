@@ -11,13 +11,90 @@
 #-----------------------------------------------------------------------------
 
 import os
+import csv
+import json
+import time
 import hashlib
 import sqlite3
+import threading
 from sqlite3 import Error
-from Constants import RAN_LEN
+from collections import OrderedDict
+from Constants import RAN_LEN, DB_BUSY_TIMEOUT, DB_CACHE_KB, DB_MMAP_SIZE
+from Constants import SENSOR_CACHE_SIZE, SENSOR_CACHE_TTL, DB_BULK_CHUNK
+from Constants import USER_CACHE_SIZE, USER_CACHE_TTL
 import firmwGlobal as gv
 DE_USER = ("admin", os.urandom(RAN_LEN).hex(), '123')   # defualt user.
 
+# firmwareInfo fields of the bulk import/export(CSV header, JSON Lines keys).
+FW_INFO_FIELDS = ('sensorID', 'signerID', 'challenge', 'swatt', 'date', 'type',
+                  'version', 'certPath', 'signatureClient', 'signatureServer')
+
+# Schema migration steps: (schema version, sql list). The steps newer than the
+# data base 'PRAGMA user_version' are applied to upgrade the file in place.
+SCHEMA_MIGRATIONS = (
+    # v1: index the sensor registration lookups, (sensorID, version) also
+    # serves the sensorID only lookups.
+    (1, ('CREATE INDEX IF NOT EXISTS idxFwSignServer ON firmwareInfo(signatureServer)',
+         'CREATE INDEX IF NOT EXISTS idxFwSensorVer ON firmwareInfo(sensorID, version)')),
+)
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class lruCache(object):
+    """ LRU cache of the data base lookups(key -> value tuple) with the hit/miss
+        counters, the entries older than ttl seconds are expired.
+    """
+    def __init__(self, maxSize, ttl):
+        self.maxSize = maxSize
+        self.ttl = ttl
+        # key -> (value, expire time), least recent used first.
+        self.entries = OrderedDict()
+        self.hits = self.misses = 0
+        self.lock = threading.Lock()
+
+#--lruCache--------------------------------------------------------------------
+    def get(self, key):
+        """ Return the cached value of the key, None if not cached."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[1] > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry: self.entries.pop(key)
+            self.misses += 1
+            return None
+
+#--lruCache--------------------------------------------------------------------
+    def put(self, key, value):
+        """ Add/refresh the key, remove the least recent used ones if the cache
+            is full.
+        """
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxSize:
+                self.entries.popitem(last=False)
+
+#--lruCache--------------------------------------------------------------------
+    def invalidate(self, key=None):
+        """ Remove the key.(remove all if key is None)"""
+        with self.lock:
+            if key is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(key, None)
+
+#--lruCache--------------------------------------------------------------------
+    def stats(self):
+        """ Return the (hits, misses, hit rate) of the cache."""
+        total = self.hits + self.misses
+        return (self.hits, self.misses, float(self.hits)/total if total else 0.0)
+
+#--lruCache--------------------------------------------------------------------
+    def __len__(self):
+        return len(self.entries)
+
 #-----------------------------------------------------------------------------
 #-----------------------------------------------------------------------------
 class firmwDBMgr(object):
@@ -28,6 +105,15 @@ class firmwDBMgr(object):
         """
         self.sql_firwareInfo_table = None
         self.sql_user_table = None
+        # Connection pool: every thread uses its own connection(self.conn).
+        self.dbLocal = threading.local()
+        self.connPool = []
+        self.lock = threading.Lock()
+        # Authorized sensors cache for the sensor registration: server 
+        # signature -> (sensorID, type, version).
+        self.sensorCache = lruCache(SENSOR_CACHE_SIZE, SENSOR_CACHE_TTL)
+        # User credential cache for the login: user -> (salt, pwdHash).
+        self.userCache = lruCache(USER_CACHE_SIZE, USER_CACHE_TTL)
         if not os.path.exists(gv.DB_PATH):
             print("DBmgr: Data base file is missing, create new data base file")
             # Table to save the firmware sign data.
@@ -50,14 +136,14 @@ class firmwDBMgr(object):
                                 salt text NOT NULL,
                                 pwdHash text NOT NULL
                             );"""
-        # Connect to database.
-        self.conn = self.createConnection(gv.DB_PATH)
         # create the table if the BD is first time created one.
         if self.sql_firwareInfo_table and self.conn:
             self.createTable(self.sql_firwareInfo_table)
             self.createTable(self.sql_user_table)
             # Add default user if create the new database.
             self.addUser(DE_USER)
+        # Upgrade the schema of the new or existing data base.
+        if self.conn: self.migrateSchema()
         # Test whether the user is in database.
         self.addUser(('123', os.urandom(RAN_LEN).hex(), '123'))
         print(self.authorizeUser('123', '123'))
@@ -71,35 +157,26 @@ class firmwDBMgr(object):
         user, salt, pwd = args
         pwdhash = hashlib.sha256(bytes.fromhex(salt) + str(pwd).encode('utf-8')).hexdigest()
         # Check wether user in the DB already:
-        selectSQL = '''SELECT * FROM userInFo WHERE user=?'''
-        with self.conn:
-            cur = self.conn.cursor()
-            cur.execute(selectSQL, (str(user),))
-            rows = cur.fetchall()
-            if len(rows):
-                print("DBmgr: The user <%s> is in database." % str(user))
-                return False
+        if self.getUserRcd(user):
+            print("DBmgr: The user <%s> is in database." % str(user))
+            return False
         print("DBmgr: Add user <%s> into the data base." % str(user))
         insertSQL = ''' INSERT INTO userInFo(user, salt, pwdHash)
                 VALUES(?,?,?) '''
         with self.conn: # use 'with' will do the auto-commit to database.
             cur = self.conn.cursor()
             cur.execute(insertSQL, (str(user), salt, str(pwdhash)))
+        self.userCache.invalidate(str(user))
         return True
 
 #--firmwDBMgr------------------------------------------------------------------
     def authorizeUser(self, user, pwd):
         """ Authorize user and its password. """
-        # Check wether user in the DB already:
-        selectSQL = '''SELECT * FROM userInFo WHERE user=?'''
-        with self.conn:
-            cur = self.conn.cursor()
-            cur.execute(selectSQL, (str(user),))
-            rows = cur.fetchall()
-            if len(rows):
-                _, salt, pwdhash = rows[0] # user ID is unique in the database.
-                if pwdhash == hashlib.sha256(bytes.fromhex(salt) + str(pwd).encode('utf-8')).hexdigest():
-                    return True
+        userRcd = self.getUserRcd(user)
+        if userRcd:
+            salt, pwdhash = userRcd
+            if pwdhash == hashlib.sha256(bytes.fromhex(salt) + str(pwd).encode('utf-8')).hexdigest():
+                return True
         return False
 
 #--firmwDBMgr------------------------------------------------------------------
@@ -108,37 +185,46 @@ class firmwDBMgr(object):
         if len(args) != 5:
             print("DBmgr: Sensor register parameter missing %s" %str(args))
             return False
-        signature ,seId, seType, seFwVersion, time = args
+        signature ,seId, seType, seFwVersion, _ = args
+        # Only trust the cached match, check the data base for the others.
+        if self.sensorCache.get(signature) == (seId, seType, str(seFwVersion)):
+            return True
         selectSQL = '''SELECT * FROM firmwareInfo WHERE signatureServer=?'''
-        conn = sqlite3.connect(gv.DB_PATH, check_same_thread=False)
-        # Create a new connection as this function is called by the sub-thread. 
-        # To avoid the error: "ProgrammingError: SQLite objects created in 
-        # a thread can only be used in that same thread"  
-        with conn:
-            cur = conn.cursor()
+        with self.conn:
+            cur = self.conn.cursor()
             cur.execute(selectSQL, (signature,))
             rows = cur.fetchall()
             if len(rows):
                 print("DBmgr: find the sensor signature")
-                for row in rows: 
-                    if seId == row[1] and seType == row[6] and str(seFwVersion) == row[7]:
-                        return True
-                    else:
-                        return False
+                row = rows[0]
+                self.sensorCache.put(signature, (row[1], row[6], row[7]))
+                return seId == row[1] and seType == row[6] and str(seFwVersion) == row[7]
         return False
 
 #--firmwDBMgr------------------------------------------------------------------
     def checkUser(self, userName):
         """ Check whehter the user is in the data base. """
-        selectSQL = '''SELECT * FROM userInFo WHERE user=?'''
+        if self.getUserRcd(userName):
+            print("DBmgr: The user %s is exists" % str(userName))
+            return True
+        return False
+
+#--firmwDBMgr------------------------------------------------------------------
+    def getUserRcd(self, userName):
+        """ Return the user's (salt, pwdHash) from the user cache or the data 
+            base, None if the user is not in the data base.
+        """
+        user = str(userName)
+        userRcd = self.userCache.get(user)
+        if userRcd: return userRcd
+        selectSQL = '''SELECT salt, pwdHash FROM userInFo WHERE user=?'''
         with self.conn:
             cur = self.conn.cursor()
-            cur.execute(selectSQL, (str(userName),))
-            rows = cur.fetchall()
-            if len(rows):
-                print("DBmgr: The user %s is exists" % str(userName))
-                return True
-        return False
+            cur.execute(selectSQL, (user,))
+            row = cur.fetchone() # user ID is unique in the database.
+        if row is None: return None
+        self.userCache.put(user, tuple(row))
+        return tuple(row)
 
 #--firmwDBMgr------------------------------------------------------------------
     def createTable(self, create_table_sql):
@@ -150,15 +236,68 @@ class firmwDBMgr(object):
         except Error as e:
             print(e)
 
+#--firmwDBMgr------------------------------------------------------------------
+    def close(self):
+        """ Close all the data base connections(the server is stopped)."""
+        with self.lock:
+            for conn in self.connPool: conn.close()
+            self.connPool = []
+        self.dbLocal = threading.local()
+
 #--firmwDBMgr------------------------------------------------------------------
     def createConnection(self, db_file):
-        """ Create a database connection to a SQLite database """
+        """ Create a database connection to a SQLite database. WAL journal is
+            used so the readers don't block the writer(and the other way).
+        """
         try:
-            return sqlite3.connect(db_file)
+            # check_same_thread=False: close() is called by the main thread.
+            conn = sqlite3.connect(db_file, timeout=DB_BUSY_TIMEOUT, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL') # WAL keeps the DB consistent.
+            conn.execute('PRAGMA cache_size=-%d' % DB_CACHE_KB)
+            conn.execute('PRAGMA mmap_size=%d' % DB_MMAP_SIZE)
+            conn.execute('PRAGMA temp_store=MEMORY')
+            return conn
         except Error as e:
             print(e)
             return None
 
+#--firmwDBMgr------------------------------------------------------------------
+    @property
+    def conn(self):
+        """ Return the connection of the current thread, create it when the
+            thread uses the data base first time.
+        """
+        conn = getattr(self.dbLocal, 'conn', None)
+        if conn is None:
+            conn = self.dbLocal.conn = self.createConnection(gv.DB_PATH)
+            if conn:
+                with self.lock:
+                    self.connPool.append(conn)
+        return conn
+
+#--firmwDBMgr------------------------------------------------------------------
+    def migrateSchema(self):
+        """ Apply the SCHEMA_MIGRATIONS steps newer than the data base schema 
+            version in one transaction, return the schema version(None if 
+            failed).
+        """
+        try:
+            with self.conn:
+                cur = self.conn.cursor()
+                version = cur.execute('PRAGMA user_version').fetchone()[0]
+                steps = [step for step in SCHEMA_MIGRATIONS if step[0] > version]
+                if not steps: return version
+                cur.execute('BEGIN')
+                for version, sqlList in steps:
+                    for sql in sqlList: cur.execute(sql)
+                    cur.execute('PRAGMA user_version = %d' % version)
+                print("DBmgr: Data base schema upgraded to version <%s>." % str(version))
+                return version
+        except Error as e:
+            print("DBmgr: Data base schema upgrade failed: <%s>." % str(e))
+            return None
+
 #--firmwDBMgr------------------------------------------------------------------
     def createFmSignRcd(self, rcdArgs):
         """ Create a firmware sign record in the data base."""
@@ -173,7 +312,136 @@ class firmwDBMgr(object):
             cur = self.conn.cursor()
             cur.execute(sql, rcdArgs)
             print("DBmgr: This is the cursir UD: <%s>" %str(cur.lastrowid))
-            return cur.lastrowid
+        self.cacheSensor(rcdArgs)
+        return cur.lastrowid
+
+#--firmwDBMgr------------------------------------------------------------------
+    def createFmSignRcds(self, rcdList, cache=True):
+        """ Create a batch of firmware sign records in one transaction, return
+            the created record number or None if failed. cache: add the 
+            sensors to the authorized sensors cache.
+        """
+        for rcdArgs in rcdList:
+            if len(rcdArgs) != 10: 
+                print("DBmgr: The firmware sign inforamtion <%s> element missing." %str(rcdArgs))
+                return None
+        sql = ''' INSERT INTO firmwareInfo( sensorID, signerID,challenge, swatt, date, type, version, certPath, signatureClient, signatureServer)
+                VALUES(?,?,?,?,?,?,?,?,?,?) '''
+        try:
+            with self.conn:
+                cur = self.conn.cursor()
+                cur.executemany(sql, rcdList)
+        except Error as e:
+            print("DBmgr: Create sign records failed: <%s>." %str(e))
+            return None
+        if cache:
+            for rcdArgs in rcdList: self.cacheSensor(rcdArgs)
+        return cur.rowcount
+
+#--firmwDBMgr------------------------------------------------------------------
+    def importFmSignRcds(self, filePath, fmt=None, chunkSize=DB_BULK_CHUNK):
+        """ Import the firmware sign records from a CSV(with FW_INFO_FIELDS 
+            header) or JSON Lines file, every chunkSize records are saved in
+            one transaction. fmt: 'csv' or 'jsonl'(use the file extension if
+            None). The malformed records are skipped, if a chunk can not be
+            saved the import stops and the saved chunks are kept(the import
+            can be partial). Return the imported record number, None if the
+            format is not supported. The imported sensors are not cached(keep
+            the hot sensors in the cache, they are cached when authorized).
+        """
+        fmt = fmt or os.path.splitext(filePath)[1].lstrip('.').lower()
+        if fmt not in ('csv', 'jsonl'):
+            print("DBmgr: Bulk import file format <%s> not supported." %str(fmt))
+            return None
+        count, startT = 0, time.monotonic()
+        with open(filePath, 'r', newline='', encoding='utf-8') as fh:
+            rows = csv.DictReader(fh) if fmt == 'csv' else (line for line in fh if line.strip())
+            chunk = []
+            for idx, row in enumerate(rows, 1):
+                rcdArgs = self._parseImportRcd(row, fmt)
+                if rcdArgs is None:
+                    print("DBmgr: Skip the malformed record <%s> of <%s>." %(str(idx), filePath))
+                    continue
+                chunk.append(rcdArgs)
+                if len(chunk) < chunkSize: continue
+                if self.createFmSignRcds(chunk, cache=False) is None: break
+                count, chunk = count + len(chunk), []
+            else:
+                if chunk and self.createFmSignRcds(chunk, cache=False) is not None:
+                    count, chunk = count + len(chunk), []
+        if chunk: print("DBmgr: Bulk import stopped at a failed chunk.")
+        self._reportRate('Imported', count, startT)
+        return count
+
+#--firmwDBMgr------------------------------------------------------------------
+    def _parseImportRcd(self, row, fmt):
+        """ Convert a CSV row dict or a JSON Lines line to the record field list
+            (the NULL type exported as '' in CSV is converted back to None), 
+            return None if the record is malformed.
+        """
+        try:
+            if fmt == 'jsonl': row = json.loads(row)
+            rcdArgs = [row[key] for key in FW_INFO_FIELDS]
+        except (KeyError, TypeError, ValueError):
+            return None
+        typeIdx = FW_INFO_FIELDS.index('type')
+        if rcdArgs[typeIdx] == '': rcdArgs[typeIdx] = None
+        if any(val is None for idx, val in enumerate(rcdArgs) if idx != typeIdx):
+            return None
+        return rcdArgs
+
+#--firmwDBMgr------------------------------------------------------------------
+    def iterFmSignRcds(self, chunkSize=DB_BULK_CHUNK):
+        """ Generator of all the firmware sign records(FW_INFO_FIELDS order), 
+            fetch chunkSize records from the cursor every time.
+        """
+        sql = 'SELECT %s FROM firmwareInfo ORDER BY id' % ', '.join(FW_INFO_FIELDS)
+        cur = self.conn.cursor()
+        try:
+            cur.execute(sql)
+            rows = cur.fetchmany(chunkSize)
+            while rows:
+                for row in rows: yield row
+                rows = cur.fetchmany(chunkSize)
+        finally:
+            cur.close()
+
+#--firmwDBMgr------------------------------------------------------------------
+    def exportFmSignRcds(self, filePath, fmt=None, chunkSize=DB_BULK_CHUNK):
+        """ Export all the firmware sign records to a CSV or JSON Lines file 
+            (fmt same as importFmSignRcds()), return the exported record number.
+        """
+        fmt = fmt or os.path.splitext(filePath)[1].lstrip('.').lower()
+        if fmt not in ('csv', 'jsonl'):
+            print("DBmgr: Bulk export file format <%s> not supported." %str(fmt))
+            return None
+        count, startT = 0, time.monotonic()
+        with open(filePath, 'w', newline='', encoding='utf-8') as fh:
+            if fmt == 'csv':
+                writer = csv.writer(fh)
+                writer.writerow(FW_INFO_FIELDS)
+            for row in self.iterFmSignRcds(chunkSize):
+                if fmt == 'csv':
+                    writer.writerow(row)
+                else:
+                    fh.write(json.dumps(dict(zip(FW_INFO_FIELDS, row))) + '\n')
+                count += 1
+        self._reportRate('Exported', count, startT)
+        return count
+
+#--firmwDBMgr------------------------------------------------------------------
+    def _reportRate(self, action, count, startT):
+        """ Print the bulk import/export record number and rows/sec."""
+        timeUsed = max(time.monotonic() - startT, 1e-6)
+        print("DBmgr: %s <%s> sign records in <%.2f> sec, <%d> rows/sec." 
+              %(action, str(count), timeUsed, int(count/timeUsed)))
+
+#--firmwDBMgr------------------------------------------------------------------
+    def cacheSensor(self, rcdArgs):
+        """ Add the sensor of the saved sign record to the authorized sensors
+            cache(write through).
+        """
+        self.sensorCache.put(rcdArgs[9], (rcdArgs[0], rcdArgs[5], str(rcdArgs[6])))
    
 #--firmwDBMgr------------------------------------------------------------------
     def updateRecd(self,rcd):
@@ -186,6 +454,8 @@ class firmwDBMgr(object):
         with self.conn:
             cur = self.conn.cursor()
             cur.execute(sql, rcd)
+            cur.execute('SELECT signatureServer FROM firmwareInfo WHERE id=?', (rcd[3],))
+            for row in cur.fetchall(): self.sensorCache.invalidate(row[0])
 
 #def testCase():
 #    if conn is not None: 
@@ -200,6 +470,85 @@ class firmwDBMgr(object):
     #else:
     #    print("Error! Can not create the database connection.")
     
+def testCase():
+    import tempfile
+    gv.DB_PATH = os.path.join(tempfile.mkdtemp(), 'firmwDB.db')
+    # Create an old(version 0) data base file without the indexes.
+    conn = sqlite3.connect(gv.DB_PATH)
+    conn.execute("CREATE TABLE firmwareInfo (id integer PRIMARY KEY, sensorID integer NOT NULL, signerID integer NOT NULL, challenge text NOT NULL, swatt text NOT NULL, date text NOT NULL, type text, version text NOT NULL, certPath text NOT NULL, signatureClient text NOT NULL, signatureServer text NOT NULL)")
+    conn.execute("CREATE TABLE userInFo(user text PRIMARY KEY, salt text NOT NULL, pwdHash text NOT NULL)")
+    conn.close()
+    print("Start data base schema migration test.")
+    dbMgr = firmwDBMgr()
+    plan = dbMgr.conn.execute("EXPLAIN QUERY PLAN SELECT * FROM firmwareInfo WHERE signatureServer=?", ('ab',)).fetchall()
+    if dbMgr.migrateSchema() == SCHEMA_MIGRATIONS[-1][0] and 'idxFwSignServer' in str(plan):
+        print("Data base schema migration test pass.")
+    else:
+        print("Data base schema migration test fail.")
+    # Keep a write transaction open, the reader thread should not be blocked.
+    rcd = (1, 1, 'c', 's', 'd', 't', '1.0', 'p', 'a', 'ab')
+    dbMgr.createFmSignRcd(rcd)
+    dbMgr.conn.execute('BEGIN IMMEDIATE')
+    dbMgr.conn.execute('DELETE FROM firmwareInfo')
+    dbMgr.sensorCache.invalidate()
+    result = []
+    reader = threading.Thread(target=lambda: result.append(
+        dbMgr.authorizeSensor(('ab', 1, 't', '1.0', 0))))
+    reader.start()
+    reader.join(1)
+    dbMgr.conn.rollback()
+    if result == [True] and len(dbMgr.connPool) == 2:
+        print("Data base WAL connection pool test pass.")
+    else:
+        print("Data base WAL connection pool test fail.")
+    # The saved record is cached, the updated record is invalidated.
+    hits = dbMgr.sensorCache.hits
+    authorized = dbMgr.authorizeSensor(('ab', 1, 't', '1.0', 0))
+    dbMgr.updateRecd((2, 'c', 's', 1))
+    if authorized and dbMgr.sensorCache.hits == hits + 1 and dbMgr.sensorCache.get('ab') is None \
+        and not dbMgr.authorizeSensor(('ab', 1, 't', '1.0', 0)):
+        print("Authorized sensor cache test pass.")
+    else:
+        print("Authorized sensor cache test fail.")
+    # Export the records and import them back in both formats.
+    total, cached = len(list(dbMgr.iterFmSignRcds())), len(dbMgr.sensorCache)
+    results = []
+    for fmt in ('csv', 'jsonl'):
+        filePath = os.path.join(os.path.dirname(gv.DB_PATH), 'signRcds.' + fmt)
+        results.append(dbMgr.exportFmSignRcds(filePath) == total)
+        results.append(dbMgr.importFmSignRcds(filePath, chunkSize=1) == total)
+        total *= 2
+    if all(results) and len(list(dbMgr.iterFmSignRcds(chunkSize=3))) == total \
+        and len(dbMgr.sensorCache) == cached:
+        print("Sign records bulk import/export test pass.")
+    else:
+        print("Sign records bulk import/export test fail.")
+    # The malformed records are skipped and the NULL type is kept in CSV.
+    filePath = os.path.join(os.path.dirname(gv.DB_PATH), 'badRcds.csv')
+    with open(filePath, 'w', newline='', encoding='utf-8') as fh:
+        writer = csv.writer(fh)
+        writer.writerow(FW_INFO_FIELDS)
+        writer.writerow([9, 2, 'c', 's', 'd', '', '1.0', 'p', 'sc', 'nullType'])
+        writer.writerow([9, 2, 'c'])
+    jsonPath = os.path.join(os.path.dirname(gv.DB_PATH), 'badRcds.jsonl')
+    with open(jsonPath, 'w', encoding='utf-8') as fh:
+        fh.write('{"sensorID": 9, \n[1, 2]\n')
+    rows = dbMgr.conn.execute("SELECT type FROM firmwareInfo WHERE signatureServer='nullType'").fetchall()
+    if dbMgr.importFmSignRcds(filePath) == 1 and dbMgr.importFmSignRcds(jsonPath) == 0 \
+        and dbMgr.conn.execute("SELECT type FROM firmwareInfo WHERE signatureServer='nullType'").fetchall() == rows + [(None,)]:
+        print("Sign records malformed import test pass.")
+    else:
+        print("Sign records malformed import test fail.")
+    # Login: checkUser(LI1) + authorizeUser(LI2) read the data base once.
+    hits, misses = dbMgr.userCache.hits, dbMgr.userCache.misses
+    dbMgr.addUser(('tester', os.urandom(RAN_LEN).hex(), 'pwd'))
+    if dbMgr.checkUser('tester') and dbMgr.authorizeUser('tester', 'pwd') \
+        and not dbMgr.authorizeUser('tester', 'bad') \
+        and dbMgr.userCache.stats()[:2] == (hits + 2, misses + 2):
+        print("User credential cache test pass.")
+    else:
+        print("User credential cache test fail.")
+    dbMgr.close()
+
 if __name__ == '__main__':
-    pass
-    #testCase()
+    testCase()
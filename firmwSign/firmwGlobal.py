@@ -33,6 +33,8 @@ ICON_PATH = "".join([dirpath, "\\firmwSign\\singtelIcon.ico"])
 
 # Defualt firmware path
 DEFUALT_FW = "".join([dirpath, "\\firmwSign\\firmwareSample"])
+# Signer PUFF value we keep precomputed SWATT challenges for.
+SIGNER_PUFF = 154946511204681
 
 # RSA encryp/decrypt setting:
 RSA_ENCODE_MODE = 'base64'# or 'hex' Sign encode mode.
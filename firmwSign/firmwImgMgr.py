@@ -0,0 +1,107 @@
+#!/usr/bin/python
+#-----------------------------------------------------------------------------
+# Name:        firmwImgMgr.py
+#
+# Purpose:     This module is used to create a firmware image manager which
+#              reads every firmware image once into immutable bytes and hands
+#              out zero-copy read-only memoryviews to the SWATT calculators. A
+#              loaded image is keyed by (path, size, mtime) and will be read
+#              again if the file is changed. The file is not kept open/mapped
+#              so it can be replaced(Windows) or rewritten while the server
+#              is running.
+# Author:      Yuancheng Liu
+#
+# Created:     2019/10/08
+# Copyright:   NUS – Singtel Cyber Security Research & Development Laboratory
+# License:     YC @ NUS
+#-----------------------------------------------------------------------------
+import os
+import threading
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class firmwImgMgr(object):
+    """ Firmware image registry: path -> (size, mtime, bytes)."""
+    def __init__(self):
+        self.images = {}
+        self.lock = threading.Lock()
+
+#--firmwImgMgr-----------------------------------------------------------------
+    def getImage(self, filePath):
+        """ Return a read-only memoryview of the firmware image, the file will
+            be read if it is not in the registry or it has been changed.
+            return None if the file is not exist.
+        """
+        filePath = os.path.abspath(filePath)
+        try:
+            stat = os.stat(filePath)
+        except OSError:
+            return None
+        with self.lock:
+            rcd = self.images.get(filePath)
+            if not (rcd and rcd[0] == stat.st_size and rcd[1] == stat.st_mtime_ns):
+                # Stale or new image: read the file again, the views of the
+                # old image are still valid as the bytes are immutable.
+                rcd = self._loadImage(filePath, stat)
+                if rcd is None: return None
+                self.images[filePath] = rcd
+            return memoryview(rcd[2])
+
+#--firmwImgMgr-----------------------------------------------------------------
+    def invalidate(self, filePath=None):
+        """ Remove the image from the registry.(remove all if filePath is None)"""
+        with self.lock:
+            paths = list(self.images.keys()) if filePath is None else [os.path.abspath(filePath)]
+            for path in paths:
+                self.images.pop(path, None)
+
+#--firmwImgMgr-----------------------------------------------------------------
+    def _loadImage(self, filePath, stat):
+        """ Read the file, return None if the file can not be read. The stamp
+            is taken before the read, so a file changed during the read will 
+            be read again by the next getImage().
+        """
+        try:
+            with open(filePath, 'rb') as fh:
+                data = fh.read()
+        except OSError as e:
+            print("ImgMgr: Read the firmware image <%s> failed: <%s>." % (filePath, str(e)))
+            return None
+        return (stat.st_size, stat.st_mtime_ns, data)
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+def testCase():
+    import shutil
+    import tempfile
+    samplePath = "".join([os.getcwd(), "\\firmwSign\\firmwareSample"])
+    imgMgr = firmwImgMgr()
+    print("Start image manager test.")
+    # Work on a copy, the sample file is rewritten by the reload test.
+    with tempfile.TemporaryDirectory() as tmpDir:
+        firmwarePath = os.path.join(tmpDir, 'firmwareSample')
+        shutil.copyfile(samplePath, firmwarePath)
+        view = imgMgr.getImage(firmwarePath)
+        with open(firmwarePath, 'rb') as fh:
+            data = fh.read()
+        if view is not None and view.tobytes() == data and imgMgr.getImage(firmwarePath) == view:
+            print("Image manager map test pass.")
+        else:
+            print("Image manager map test fail.")
+        # Replace the file while a view is held: the new image is loaded.
+        with open(firmwarePath + '.new', 'wb') as fh:
+            fh.write(data[:1024])
+        os.replace(firmwarePath + '.new', firmwarePath)
+        newView = imgMgr.getImage(firmwarePath)
+        if newView.tobytes() == data[:1024] and view.tobytes() == data:
+            print("Image manager reload test pass.")
+        else:
+            print("Image manager reload test fail.")
+    imgMgr.invalidate()
+    if not imgMgr.images:
+        print("Image manager invalidate test pass.")
+    else:
+        print("Image manager invalidate test fail.")
+
+if __name__ == '__main__':
+    testCase()
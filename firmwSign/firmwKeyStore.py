@@ -0,0 +1,133 @@
+#!/usr/bin/python
+#-----------------------------------------------------------------------------
+# Name:        firmwKeyStore.py
+#
+# Purpose:     This module is used to create a key/certificate store which
+#              loads every PEM file once and keeps both the raw bytes and the
+#              parsed OpenSSL object (PKey/X509), so the sign server doesn't
+#              read and parse the PEM files for every request. A loaded file
+#              is reloaded if its (size, mtime) is changed.
+# Author:      Yuancheng Liu
+#
+# Created:     2019/10/13
+# Copyright:   NUS – Singtel Cyber Security Research & Development Laboratory
+# License:     YC @ NUS
+#-----------------------------------------------------------------------------
+import os
+import time
+import threading
+from OpenSSL import crypto
+from Constants import KEY_CHECK_INTERVAL
+
+KEY_RAW = 0     # raw PEM bytes.
+KEY_PRIV = 1    # crypto.PKey private key.
+KEY_CERT = 2    # crypto.X509 certificate.
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class firmwKeyStore(object):
+    """ PEM file registry: (path, kind) -> [size, mtime, lastCheck, raw, obj]."""
+    def __init__(self, checkInterval=KEY_CHECK_INTERVAL):
+        self.checkInterval = checkInterval # min seconds between file change check.
+        self.entries = {}
+        self.lock = threading.Lock()
+
+#--firmwKeyStore---------------------------------------------------------------
+    def getRaw(self, filePath):
+        """ Return the PEM file bytes, None if the file is not exist."""
+        return self._getEntry(filePath, KEY_RAW)
+
+#--firmwKeyStore---------------------------------------------------------------
+    def getPrivateKey(self, filePath):
+        """ Return the parsed private key, None if the file is not exist or
+            can not be parsed.
+        """
+        return self._getEntry(filePath, KEY_PRIV)
+
+#--firmwKeyStore---------------------------------------------------------------
+    def getCertificate(self, filePath):
+        """ Return the parsed certificate, None if the file is not exist or
+            can not be parsed.
+        """
+        return self._getEntry(filePath, KEY_CERT)
+
+#--firmwKeyStore---------------------------------------------------------------
+    def invalidate(self, filePath=None):
+        """ Remove the file from the store.(remove all if filePath is None)"""
+        with self.lock:
+            if filePath is None:
+                self.entries.clear()
+                return
+            filePath = os.path.abspath(filePath)
+            for key in [key for key in self.entries if key[0] == filePath]:
+                self.entries.pop(key)
+
+#--firmwKeyStore---------------------------------------------------------------
+    def _getEntry(self, filePath, kind):
+        """ Return the cached object of the file, (re)load it if the file is
+            new or changed.
+        """
+        key, now = (os.path.abspath(filePath), kind), time.monotonic()
+        with self.lock:
+            rcd = self.entries.get(key)
+            if rcd and now - rcd[2] < self.checkInterval: return rcd[4]
+            try:
+                stat = os.stat(key[0])
+            except OSError:
+                print("KeyStore: The PEM file <%s> is not exist." % key[0])
+                self.entries.pop(key, None)
+                return None
+            if rcd and rcd[0] == stat.st_size and rcd[1] == stat.st_mtime_ns:
+                rcd[2] = now
+                return rcd[4]
+            rcd = self._loadEntry(key[0], kind, stat, now)
+            if rcd is None:
+                self.entries.pop(key, None)
+                return None
+            self.entries[key] = rcd
+            return rcd[4]
+
+#--firmwKeyStore---------------------------------------------------------------
+    def _loadEntry(self, filePath, kind, stat, now):
+        """ Read and parse the PEM file, return None if it can not be parsed."""
+        with open(filePath, 'rb') as fh:
+            raw = fh.read()
+        try:
+            if kind == KEY_PRIV:
+                obj = crypto.load_privatekey(crypto.FILETYPE_PEM, raw)
+            elif kind == KEY_CERT:
+                obj = crypto.load_certificate(crypto.FILETYPE_PEM, raw)
+            else:
+                obj = raw
+        except crypto.Error as e:
+            print("KeyStore: The PEM file <%s> can not be parsed: <%s>." % (filePath, str(e)))
+            return None
+        print("KeyStore: Loaded the PEM file <%s>." % filePath)
+        return [stat.st_size, stat.st_mtime_ns, now, raw, obj]
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+def testCase():
+    import firmwGlobal as gv
+    keyStore = firmwKeyStore(checkInterval=0)
+    print("Start key store test.")
+    key = keyStore.getPrivateKey(gv.SIGN_PRIV_PATH)
+    with open(gv.SIGN_PRIV_PATH, 'rb') as fh:
+        raw = fh.read()
+    if key is not None and keyStore.getPrivateKey(gv.SIGN_PRIV_PATH) is key \
+        and keyStore.getRaw(gv.SIGN_PRIV_PATH) == raw:
+        print("Key store cache test pass.")
+    else:
+        print("Key store cache test fail.")
+    # Touch the file: the key should be reloaded.
+    stat = os.stat(gv.SIGN_PRIV_PATH)
+    os.utime(gv.SIGN_PRIV_PATH, ns=(stat.st_atime_ns, stat.st_mtime_ns+1000))
+    newKey = keyStore.getPrivateKey(gv.SIGN_PRIV_PATH)
+    os.utime(gv.SIGN_PRIV_PATH, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    if newKey is not None and newKey is not key:
+        print("Key store reload test pass.")
+    else:
+        print("Key store reload test fail.")
+
+if __name__ == '__main__':
+    testCase()
@@ -0,0 +1,94 @@
+#!/usr/bin/python
+#-----------------------------------------------------------------------------
+# Name:        firmwLifecycle.py
+#
+# Purpose:     This module is used to manage the sign server life cycle:
+#               - SIGTERM/SIGINT: stop accepting, drain the in-flight sessions
+#                 (until SERV_DRAIN_TIMEOUT), flush the sign records and exit.
+#               - SIGHUP: hot restart, start a new server process which
+#                 inherits the listening sockets(fd passing), then drain the
+#                 old process. The connections waiting in the listen backlog
+#                 are accepted by the new process, so no one is refused.
+# Author:      Yuancheng Liu
+#
+# Created:     2019/10/16
+# Copyright:   NUS – Singtel Cyber Security Research & Development Laboratory
+# License:     YC @ NUS
+#-----------------------------------------------------------------------------
+import os
+import sys
+import signal
+import subprocess
+from Constants import SERV_DRAIN_TIMEOUT
+
+# Environment variable of the inherited listening sockets: "name:fd,name:fd".
+LISTEN_FD_ENV = 'FIRMW_LISTEN_FDS'
+
+#-----------------------------------------------------------------------------
+def inheritedFd(name):
+    """ Return the listening socket fd of the name passed by the old server
+        process, None if the server is not started by a hot restart.
+    """
+    for item in os.environ.get(LISTEN_FD_ENV, '').split(','):
+        key, _, fd = item.partition(':')
+        if key == name and fd.isdigit(): return int(fd)
+    return None
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class servLifecycle(object):
+    """ Run the server, server must provide stopAccept(timeout), shutdown(
+        timeout) and listenFds().
+    """
+    def __init__(self, server, drainTimeout=SERV_DRAIN_TIMEOUT):
+        self.server = server
+        self.drainTimeout = drainTimeout
+        self.newProc = None     # new server process of the hot restart.
+
+#--servLifecycle---------------------------------------------------------------
+    def installSignals(self):
+        """ Drain the server when get the stop signal, hot restart the server
+            when get SIGHUP(not supported on Windows).
+        """
+        signal.signal(signal.SIGTERM, self._onStop)
+        signal.signal(signal.SIGINT, self._onStop)
+        if hasattr(signal, 'SIGHUP'):
+            signal.signal(signal.SIGHUP, self._onRestart)
+
+#--servLifecycle---------------------------------------------------------------
+    def _onStop(self, signum, frame):
+        print("Lifecycle: get signal <%s>, stop the server." % str(signum))
+        self.server.stopAccept(self.drainTimeout)
+
+#--servLifecycle---------------------------------------------------------------
+    def _onRestart(self, signum, frame):
+        print("Lifecycle: get signal <%s>, restart the server." % str(signum))
+        if self.newProc is None: self.handOver()
+        self.server.stopAccept(self.drainTimeout)
+
+#--servLifecycle---------------------------------------------------------------
+    def handOver(self):
+        """ Start a new server process with the same arguments, pass the
+            listening sockets to it. Return the process, None if failed.
+        """
+        fds = self.server.listenFds()
+        try:
+            for fd in fds.values(): os.set_inheritable(fd, True)
+            env = dict(os.environ)
+            env[LISTEN_FD_ENV] = ','.join(['%s:%d' % item for item in fds.items()])
+            self.newProc = subprocess.Popen([sys.executable] + sys.argv, env=env,
+                                            pass_fds=tuple(fds.values()))
+        except Exception as e:
+            print("Lifecycle: start the new server process failed: <%s>." % str(e))
+            return None
+        print("Lifecycle: new server process <%s> started." % str(self.newProc.pid))
+        return self.newProc
+
+#--servLifecycle---------------------------------------------------------------
+    def run(self, serveFunc):
+        """ Call serveFunc() which returns after the server stopped accepting,
+            then drain and shut down the server.
+        """
+        self.installSignals()
+        serveFunc()
+        self.server.shutdown(self.drainTimeout)
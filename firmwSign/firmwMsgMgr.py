@@ -5,7 +5,12 @@
 #              user message to a json string/bytes data and 'load' back to the 
 #              orignal data.(The detail usage you can follow the example in the
 #              testCase, all the bytes type data in the json will be convert to
-#              hex format.) 
+#              hex format.) With framing enabled, every message is sent as
+#              a frame: 1 byte tag + 4 bytes big-endian payload length +
+#              payload, and the frameReader splits the received bytes into
+#              complete frames. A request can carry a request ID('rid')
+#              which the reply copies, so requests can be pipelined and
+#              replied out of order.
 # Author:      Yuancheng Liu
 #
 # Created:     2019/05/09
@@ -16,7 +21,11 @@
 import os
 import json
 import time
-from Constants import CMD_TYPE, FILE_TYPE, RAN_LEN
+import struct
+import asyncio
+from Constants import CMD_TYPE, FILE_TYPE, RAN_LEN, FRAME_RECV_SIZE, FRAME_MAX_SIZE
+
+FRAME_HEAD = struct.Struct('>cI')  # frame header: tag + payload length.
 
 # Message dump action type:
 # CR    - Connection request
@@ -28,6 +37,8 @@ from Constants import CMD_TYPE, FILE_TYPE, RAN_LEN
 # LO    - Logout requst.
 # CF    - Certificate file fetch.    
 # SR    - Signature response
+# SB    - Bulk signature response [list of SR sign entries]
+# BR    - Bulk signature result [list of server signatures(client<-server)]
 # RG    - Sensor Gateway registration. 
 
 #-----------------------------------------------------------------------------
@@ -36,14 +47,19 @@ class msgMgr(object):
     """ Create a message manager to dump the user message to a json string/bytes
         data and load back to orignal data.
     """
-    def __init__(self, parent):
+    def __init__(self, parent, framing=False):
+        """ framing: dump the message as length-prefixed frame and load the 
+            frames read by frameReader.
+        """
         self.parent = parent
+        self.framing = framing
 
 #--msgMgr----------------------------------------------------------------------
-    def dumpMsg(self, action=None, dataArgs=None):
+    def dumpMsg(self, action=None, dataArgs=None, rid=None):
         """ Create the bytes message base on the action for sending to server.
             returned the created message or None if the action is invalid.
             Message sample: 'C'.encode('utf-8')+dict{'act': str, [data]}
+            rid: request ID(int) added in the cmd message as 'rid'.
         """
         datab = None
         if action == 'CR':
@@ -65,21 +81,43 @@ class msgMgr(object):
             datab = self._createFLmsg(dataArgs)
         elif action == 'SR':
             datab = self._createSRmsg(dataArgs)
+        elif action == 'SB':
+            datab = self._createSBmsg(dataArgs)
+        elif action == 'BR':
+            datab = self._createBRmsg(dataArgs)
         elif action == 'LO':
             datab = self._createLOmsg()
         elif action == 'RG':
             datab = self._createRGmsg(dataArgs)
         else:
             print("The input action <%s> is invlid" %str(action))
+        if datab:
+            # LI1 and LR1 return (message, random bytes).
+            if isinstance(datab, tuple):
+                datab = (self._packMsg(datab[0], rid), datab[1])
+            else:
+                datab = self._packMsg(datab, rid)
         return datab
 
 #--msgMgr----------------------------------------------------------------------
     def loadMsg(self, msg):
         """ Convert the dumpped message back to orignal data."""
         tag = msg[0:1] # Take out the tag data.
-        data = json.loads(msg[1:]) if tag == CMD_TYPE else msg[1:]
+        body = msg[FRAME_HEAD.size:] if self.framing else msg[1:]
+        data = json.loads(body) if tag == CMD_TYPE else body
         return data
 
+#--msgMgr----------------------------------------------------------------------
+    def _packMsg(self, msg, rid):
+        """ Dump the cmd message dict(with the request ID) to json and pack the
+            message to frame if framing is enabled. (The file message has no 
+            request ID.)
+        """
+        if isinstance(msg, dict):
+            if rid is not None: msg['rid'] = int(rid)
+            msg = CMD_TYPE + json.dumps(msg).encode('utf-8')
+        return packFrame(msg) if self.framing else msg
+
 #--msgMgr----------------------------------------------------------------------
     def _createCRmsg(self):
         """ Create the connection request message."""
@@ -87,7 +125,7 @@ class msgMgr(object):
             "act"   : 'CR',
             "time"  : time.time()
         }
-        return CMD_TYPE + json.dumps(msgDict).encode('utf-8')
+        return msgDict
 
 #--msgMgr----------------------------------------------------------------------
     def _createHBmsg(self, lastAct, state):
@@ -98,7 +136,7 @@ class msgMgr(object):
             "lAct"  : lastAct,  # last received action 
             "state" : state     # last action execution state/data
         }
-        return CMD_TYPE + json.dumps(msgDict).encode('utf-8')
+        return msgDict
 
 #--msgMgr----------------------------------------------------------------------
     def _createLI1msg(self, userName):
@@ -110,8 +148,7 @@ class msgMgr(object):
             "user"      : userName.strip(),
             "random1"   : randomB.hex()
         }
-        data = CMD_TYPE + json.dumps(msgDict).encode('utf-8')
-        return (data, randomB)
+        return (msgDict, randomB)
 
 #--msgMgr----------------------------------------------------------------------
     def _createLI2msg(self, args):
@@ -122,8 +159,7 @@ class msgMgr(object):
             "random2"   : random2,
             "password"  : password 
         }
-        data = CMD_TYPE + json.dumps(msgDict).encode('utf-8')
-        return data
+        return msgDict
 
 #--msgMgr----------------------------------------------------------------------
     def _createLR1msg(self, args):
@@ -136,8 +172,7 @@ class msgMgr(object):
             "random1"   : randomB,
             "random2"   : randomB2.hex() 
         }
-        data = CMD_TYPE + json.dumps(msgDict).encode('utf-8')
-        return (data, randomB2)
+        return (msgDict, randomB2)
 
 #--msgMgr----------------------------------------------------------------------
     def _createLR2msg(self, challengeStr):
@@ -147,7 +182,7 @@ class msgMgr(object):
             "act"       : 'LR2',
             "challenge" : challengeStr.strip(),
         }
-        return CMD_TYPE + json.dumps(msgDict).encode('utf-8')
+        return msgDict
 
 #--msgMgr----------------------------------------------------------------------
     def _createLOmsg(self):
@@ -156,7 +191,7 @@ class msgMgr(object):
             "act"   : 'LO',
             "time"  : time.time()
         }
-        return CMD_TYPE + json.dumps(msgDict).encode('utf-8')
+        return msgDict
 
 #--msgMgr----------------------------------------------------------------------
     def _createCFmsg(self):
@@ -165,17 +200,48 @@ class msgMgr(object):
             "act"   : 'CF',
             "time"  : time.time()
         }
-        return CMD_TYPE + json.dumps(msgDict).encode('utf-8')
+        return msgDict
 
 #--msgMgr----------------------------------------------------------------------
     def _createSRmsg(self, args):
         """ Create a sign response message.(Sign client->Sever) """
+        msgDict = self._createSRentry(args)
+        if msgDict is None: return None
+        msgDict['act'] = 'SR'
+        return msgDict
+
+#--msgMgr----------------------------------------------------------------------
+    def _createSBmsg(self, argsList):
+        """ Create a bulk sign response message, argsList is a list of the SR 
+            message args of one firmware.(Sign client->Sever)
+        """
+        entries = [self._createSRentry(args) for args in argsList]
+        if not entries or None in entries: return None
+        msgDict = {
+            "act"       : 'SB',
+            "entries"   : entries   # SR sign entry list.
+        }
+        return msgDict
+
+#--msgMgr----------------------------------------------------------------------
+    def _createBRmsg(self, signatures):
+        """ Create a bulk sign result message: the server signature of every
+            SB entry(0 if the entry is not signed).(Sever->Sign client)
+        """
+        msgDict = {
+            "act"       : 'BR',
+            "signs"     : [sign.hex() if isinstance(sign, bytes) else sign for sign in signatures]
+        }
+        return msgDict
+
+#--msgMgr----------------------------------------------------------------------
+    def _createSRentry(self, args):
+        """ Create the sign entry dict of the SR/SB message."""
         if len(args) != 7:
             print("Msgmgr: The required element missing in the RS msg<%s>" %str(args))
             return None
         sensorId, signerId, swatt, date, typeS, versionS, signS = args
-        msgDict = {
-            "act"       : 'SR',     
+        return {
             "id"        : sensorId,     # sensor ID
             "sid"       : signerId,     # Signer factory user ID.
             "swatt"     : swatt,        # File SWATT value. 
@@ -184,7 +250,6 @@ class msgMgr(object):
             "version"   : versionS,     # Sensor version.
             "signStr"   : signS.hex()   # Signature string.
         }
-        return CMD_TYPE + json.dumps(msgDict).encode('utf-8')
 
 #--msgMgr----------------------------------------------------------------------
     def _createRGmsg(self, args):
@@ -202,13 +267,83 @@ class msgMgr(object):
             "version"   : fwVersion,    # Sensor version.
             "signStr"   : signS         # Signature string.
         }
-        return CMD_TYPE + json.dumps(msgDict).encode('utf-8')
+        return msgDict
 
 #--msgMgr----------------------------------------------------------------------
     def _createFLmsg(self, bytesData):
         """ Create the file message."""
         return FILE_TYPE + bytesData
 
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class frameReader(object):
+    """ Buffer the bytes received by recvFunc(bufferSize) and return the 
+        complete frames one by one, so a frame can be split in many recv()
+        and one recv() can carry many (pipelined) frames.
+    """
+    def __init__(self, recvFunc, recvSize=FRAME_RECV_SIZE, maxFrame=FRAME_MAX_SIZE,
+                 waitFunc=None):
+        """ waitFunc: called before every recvFunc() call(block until there is 
+            data to receive).
+        """
+        self.recvFunc = recvFunc
+        self.waitFunc = waitFunc
+        self.recvSize = recvSize
+        self.maxFrame = maxFrame
+        self.buffer = bytearray()
+
+#--frameReader-----------------------------------------------------------------
+    def readFrame(self):
+        """ Return the next complete frame, None if the connection is closed."""
+        while True:
+            frame = self.nextFrame()
+            if frame is not None: return frame
+            if self.waitFunc: self.waitFunc()
+            data = self.recvFunc(self.recvSize)
+            if not data: return None
+            self.feed(data)
+
+#--frameReader-----------------------------------------------------------------
+    def feed(self, data):
+        """ Add the received data in the buffer(used when the caller does the 
+            recv() itself, e.g. the non-blocking servers).
+        """
+        self.buffer += data
+
+#--frameReader-----------------------------------------------------------------
+    def nextFrame(self):
+        """ Take out the next complete frame in the buffer, None if there is 
+            not one.
+        """
+        if len(self.buffer) < FRAME_HEAD.size: return None
+        _, length = FRAME_HEAD.unpack_from(self.buffer)
+        if length > self.maxFrame:
+            raise ValueError("Frame length <%s> over the limit." %str(length))
+        end = FRAME_HEAD.size + length
+        if len(self.buffer) < end: return None
+        frame = bytes(self.buffer[:end])
+        del self.buffer[:end]
+        return frame
+
+#-----------------------------------------------------------------------------
+def packFrame(msg):
+    """ Convert the tag + payload message to a frame."""
+    return FRAME_HEAD.pack(msg[0:1], len(msg)-1) + msg[1:]
+
+#-----------------------------------------------------------------------------
+async def readFrameAsync(reader, maxFrame=FRAME_MAX_SIZE):
+    """ Read one complete frame from the asyncio stream reader, return None if
+        the connection is closed.
+    """
+    try:
+        head = await reader.readexactly(FRAME_HEAD.size)
+        _, length = FRAME_HEAD.unpack(head)
+        if length > maxFrame:
+            raise ValueError("Frame length <%s> over the limit." %str(length))
+        return head + await reader.readexactly(length)
+    except asyncio.IncompleteReadError:
+        return None
+
 #-----------------------------------------------------------------------------
 #-----------------------------------------------------------------------------
 def testCase():
@@ -332,6 +467,40 @@ def testCase():
         pCount += 1
         print("Sensor resigtor requset test fail")
 
+    #
+    tPass = True
+    print("Message frame test:")
+    frameMgr = msgMgr(None, framing=True)
+    fileData = os.urandom(3*FRAME_RECV_SIZE)
+    stream = frameMgr.dumpMsg(action='CR') + frameMgr.dumpMsg(action='FL', dataArgs=fileData)
+    chunks = [stream[i:i+1000] for i in range(0, len(stream), 1000)]
+    reader = frameReader(lambda size: chunks.pop(0) if chunks else b'')
+    tPass = tPass and frameMgr.loadMsg(reader.readFrame())['act'] == 'CR'
+    tPass = tPass and frameMgr.loadMsg(reader.readFrame()) == fileData
+    tPass = tPass and reader.readFrame() is None
+    msg = frameMgr.dumpMsg(action='HB', dataArgs=('SR', 1), rid=7)
+    tPass = tPass and frameMgr.loadMsg(msg)['rid'] == 7
+    if tPass:
+        print("Message frame test pass")
+    else:
+        pCount += 1
+        print("Message frame test fail")
+
+    #
+    tPass = True
+    print("Bulk sign request test:")
+    entry = (100, 200, '0x1234', '2019-10-14', 'XKAK_PPL_COUNT', '1.01', b'sign')
+    msgDict = testMsgr.loadMsg(testMsgr.dumpMsg(action='SB', dataArgs=[entry]*3))
+    tPass = tPass and msgDict['act'] == 'SB' and len(msgDict['entries']) == 3
+    tPass = tPass and msgDict['entries'][0]['signStr'] == b'sign'.hex()
+    msgDict = testMsgr.loadMsg(testMsgr.dumpMsg(action='BR', dataArgs=[b'sign', 0]))
+    tPass = tPass and msgDict['act'] == 'BR' and msgDict['signs'] == [b'sign'.hex(), 0]
+    if tPass:
+        print("Bulk sign requset test pass")
+    else:
+        pCount += 1
+        print("Bulk sign requset test fail")
+
     print("Test done total <%s> fail" %str(pCount))
 
 #-----------------------------------------------------------------------------
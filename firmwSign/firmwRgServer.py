@@ -0,0 +1,232 @@
+#!/usr/bin/python
+#-----------------------------------------------------------------------------
+# Name:        firmwRgServer.py
+#
+# Purpose:     This module is used to create the sensor registration server
+#              which serves many sensor TLS connections in one thread with a
+#              selectors event loop (non-blocking accept/recv/send). Every
+#              connection follows the CR -> RG -> LO state machine, the idle
+#              connections are closed after RG_TIMEOUT seconds.
+# Author:      Yuancheng Liu
+#
+# Created:     2019/10/15
+# Copyright:   NUS – Singtel Cyber Security Research & Development Laboratory
+# License:     YC @ NUS
+#-----------------------------------------------------------------------------
+import time
+import selectors
+import threading
+from OpenSSL import SSL
+import firmwMsgMgr
+import firmwTLSserver as SSLS
+import firmwGlobal as gv
+from Constants import FRAME_RECV_SIZE, RG_BACKLOG, RG_TIMEOUT
+
+# Registration connection state:
+RG_ST_INIT = 0      # wait for the connection request(CR).
+RG_ST_CONN = 1      # connected, wait for the registration(RG).
+RG_ST_DONE = 2      # registered, wait for logout(LO).
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class rgConnection(object):
+    """ State of one sensor registration connection."""
+    __slots__ = ('conn', 'addr', 'state', 'reader', 'outBuf', 'closing', 'lastActive')
+
+    def __init__(self, conn, addr):
+        self.conn = conn
+        self.addr = addr
+        self.state = RG_ST_INIT
+        self.reader = firmwMsgMgr.frameReader(None)  # frames are fed by the loop.
+        self.outBuf = b''       # reply bytes not sent yet.
+        self.closing = False    # close after the outBuf is sent.
+        self.lastActive = time.monotonic()
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class rgSelectServer(threading.Thread):
+    """ Thread to serve the sensor registration connections with a selectors
+        event loop.
+    """
+    def __init__(self, dbMgr, port=gv.RGTCP_PORT, backlog=RG_BACKLOG, timeout=RG_TIMEOUT, fd=None):
+        threading.Thread.__init__(self)
+        self.name = "RG_select_server"
+        self.daemon = True
+        self.dbMgr = dbMgr  # get the db manager from the server.
+        self.timeout = timeout
+        self.msgMgr = firmwMsgMgr.msgMgr(self, framing=True)  # create the message manager.
+        self.sslServer = SSLS.TLS_sslServer(self)  # init ssl server.
+        self.sslServer.serverSet(port=port, listen=backlog, block=0, fd=fd)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.sslServer.server, selectors.EVENT_READ, None)
+        self.conns = {}     # fileno -> rgConnection
+        # (state, action) -> (handler, next state), LO is accepted in all state.
+        self.transitions = {
+            (RG_ST_INIT, 'CR'): (self.handleConnection, RG_ST_CONN),
+            (RG_ST_CONN, 'RG'): (self.handleRigster, RG_ST_DONE),
+            (RG_ST_DONE, 'RG'): (self.handleRigster, RG_ST_DONE)
+        }
+        self.stopDeadline = None # set by stop(): drain the connections until.
+        print("Register: Select server inited.")
+
+#--rgSelectServer--------------------------------------------------------------
+    def run(self):
+        """ Event loop to accept and serve the sensor connections."""
+        while True:
+            for key, mask in self.selector.select(timeout=1):
+                if key.data is None:
+                    self.acceptConnections()
+                    continue
+                rgConn = key.data
+                try:
+                    if mask & selectors.EVENT_READ: self.readConnection(rgConn)
+                    if mask & selectors.EVENT_WRITE and rgConn.conn: self.flushConnection(rgConn)
+                except Exception as e:
+                    print("RGConnection: connection error, exception:<%s>" %str(e))
+                    self.closeConnection(rgConn)
+            self.closeIdle()
+            if self.stopDeadline is not None and self.drain(): break
+
+#--rgSelectServer--------------------------------------------------------------
+    def stop(self, timeout=0):
+        """ Stop accepting, the event loop exits after the connections are
+            finished or timeout seconds passed.
+        """
+        self.stopDeadline = time.monotonic() + timeout
+
+#--rgSelectServer--------------------------------------------------------------
+    def drain(self):
+        """ Close the listening socket, return True if all the connections are
+            finished(or closed after the stop deadline).
+        """
+        if self.sslServer.server:
+            self.selector.unregister(self.sslServer.server)
+            self.sslServer.server.close()
+            self.sslServer.server = None
+        if self.conns and time.monotonic() < self.stopDeadline: return False
+        for rgConn in list(self.conns.values()):
+            print("RGConnection: close the unfinished connection <%s>." %str(rgConn.addr))
+            self.closeConnection(rgConn)
+        return True
+
+#--rgSelectServer--------------------------------------------------------------
+    def acceptConnections(self):
+        """ Accept all the pending connections."""
+        while True:
+            try:
+                conn, addr = self.sslServer.accept()
+            except (BlockingIOError, SSL.WantReadError):
+                return
+            except Exception as e:
+                print("RGConnection: accept error, exception:<%s>" %str(e))
+                return
+            print('RGConnection: connection address:<%s>' %str(addr))
+            conn.setblocking(False)
+            rgConn = rgConnection(conn, addr)
+            self.conns[conn.fileno()] = rgConn
+            self.selector.register(conn, selectors.EVENT_READ, rgConn)
+
+#--rgSelectServer--------------------------------------------------------------
+    def readConnection(self, rgConn):
+        """ Read all the received data(the TLS handshake is done by the first
+            reads) and handle the complete messages.
+        """
+        while rgConn.conn and not rgConn.closing:
+            try:
+                data = rgConn.conn.recv(FRAME_RECV_SIZE)
+            except SSL.WantReadError:
+                return
+            except SSL.WantWriteError:
+                self.selector.modify(rgConn.conn, selectors.EVENT_READ | selectors.EVENT_WRITE, rgConn)
+                return
+            except (SSL.ZeroReturnError, SSL.SysCallError):
+                data = None
+            if not data:
+                self.closeConnection(rgConn)
+                return
+            rgConn.lastActive = time.monotonic()
+            rgConn.reader.feed(data)
+            frame = rgConn.reader.nextFrame()
+            while frame and not rgConn.closing:
+                self.handleMessage(rgConn, self.msgMgr.loadMsg(frame))
+                frame = rgConn.reader.nextFrame()
+
+#--rgSelectServer--------------------------------------------------------------
+    def handleMessage(self, rgConn, dataDict):
+        """ Move the connection state machine with the received message."""
+        act = dataDict['act']
+        print("RGConnection: received action:<%s>" %str(act))
+        if act == 'LO':
+            self.handleLogout()
+            rgConn.closing = True
+            self.flushConnection(rgConn)
+            return
+        transition = self.transitions.get((rgConn.state, act))
+        if transition is None:
+            print("RGConnection: action <%s> not expected in state <%s>." %(act, str(rgConn.state)))
+            self.sendReply(rgConn, self.msgMgr.dumpMsg(action='HB', dataArgs=(act, 0), rid=dataDict.get('rid')))
+            return
+        handler, rgConn.state = transition
+        handler(rgConn, dataDict)
+
+#--rgSelectServer--------------------------------------------------------------
+    def sendReply(self, rgConn, data):
+        """ Add the reply to the connection out buffer and try to send it."""
+        if not data: return
+        rgConn.outBuf += data
+        self.flushConnection(rgConn)
+
+#--rgSelectServer--------------------------------------------------------------
+    def flushConnection(self, rgConn):
+        """ Send the out buffer as much as possible, wait for the write event
+            if the socket is full.
+        """
+        try:
+            while rgConn.outBuf:
+                sent = rgConn.conn.send(rgConn.outBuf)
+                rgConn.outBuf = rgConn.outBuf[sent:]
+        except (SSL.WantWriteError, SSL.WantReadError):
+            self.selector.modify(rgConn.conn, selectors.EVENT_READ | selectors.EVENT_WRITE, rgConn)
+            return
+        if rgConn.closing:
+            self.closeConnection(rgConn)
+        else:
+            self.selector.modify(rgConn.conn, selectors.EVENT_READ, rgConn)
+
+#--rgSelectServer--------------------------------------------------------------
+    def closeConnection(self, rgConn):
+        """ Unregister and close the connection."""
+        if rgConn.conn is None: return
+        conn, rgConn.conn = rgConn.conn, None
+        self.conns.pop(conn.fileno(), None)
+        try:
+            self.selector.unregister(conn)
+            conn.close()
+        except Exception as e:
+            print("RGConnection: close error, exception:<%s>" %str(e))
+
+#--rgSelectServer--------------------------------------------------------------
+    def closeIdle(self):
+        """ Close the connections idle for more than timeout seconds."""
+        deadline = time.monotonic() - self.timeout
+        for rgConn in [c for c in self.conns.values() if c.lastActive < deadline]:
+            print("RGConnection: connection <%s> idle time out." %str(rgConn.addr))
+            self.closeConnection(rgConn)
+
+#--rgSelectServer--------------------------------------------------------------
+    def handleRigster(self, rgConn, dataDict):
+        """ Handle the sensor registration request."""
+        args = (dataDict['signStr'], dataDict['id'],
+                dataDict['type'], dataDict['version'], dataDict['time'])
+        result = self.dbMgr.authorizeSensor(args)
+        self.sendReply(rgConn, self.msgMgr.dumpMsg(action='HB', dataArgs=('RG', result), rid=dataDict.get('rid')))
+
+#--rgSelectServer--------------------------------------------------------------
+    def handleLogout(self):
+        """ Handle user logout: clear all the parameters"""
+        print("RGConnection: sensor logout.")
+
+#--rgSelectServer--------------------------------------------------------------
+    def handleConnection(self, rgConn, dataDict):
+        """ handle the client connection request."""
+        self.sendReply(rgConn, self.msgMgr.dumpMsg(action='HB', dataArgs=('CR', 1), rid=dataDict.get('rid')))
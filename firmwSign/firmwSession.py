@@ -0,0 +1,159 @@
+#!/usr/bin/python
+#-----------------------------------------------------------------------------
+# Name:        firmwSession.py
+#
+# Purpose:     This module is used to create the per-connection sign session
+#              (login and SWATT state of one signer) and the session table
+#              which evicts the idle sessions, so the sign server can serve
+#              many signers in parallel without mixing their state.
+# Author:      Yuancheng Liu
+#
+# Created:     2019/10/12
+# Copyright:   NUS – Singtel Cyber Security Research & Development Laboratory
+# License:     YC @ NUS
+#-----------------------------------------------------------------------------
+import time
+import itertools
+import threading
+from collections import OrderedDict
+from Constants import SESSION_TIMEOUT, SESSION_MAX
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class SignSession(object):
+    """ Login and SWATT state of one sign client connection."""
+    __slots__ = ('sid', 'addr', 'loginUser', 'ownRandom', 'responseEpc',
+                 'expectPuff', 'ranStr', 'lastActive', 'lock', 'closeConn')
+
+    def __init__(self, sid, addr=None, closeConn=None):
+        self.sid = sid          # session ID.
+        self.addr = addr        # client address.
+        self.closeConn = closeConn # function to close the session connection.
+        self.lastActive = time.monotonic()
+        self.lock = threading.Lock() # guard the expected response pair.
+        self.reset()
+
+#--SignSession-----------------------------------------------------------------
+    def reset(self):
+        """ Clear the login parameters(logout)."""
+        self.loginUser = None
+        self.ownRandom = None
+        self.setExpect(None, None)
+        self.ranStr = ""        # random string used for Swatt challenge set.
+
+#--SignSession-----------------------------------------------------------------
+    def setExpect(self, puff, response):
+        """ Set the expected response of the firmware file and the PUFF value
+            used to calculate it. (The in-flight sign requests of the session
+            may read/set the pair in parallel.)
+        """
+        with self.lock:
+            self.expectPuff = puff      # PUFF value used to calculate the responseEpc.
+            self.responseEpc = response # expect response of the firmware file.
+
+#--SignSession-----------------------------------------------------------------
+    def getExpect(self, puff=None):
+        """ Return the expected response of the PUFF, None if not calculated.
+            Return the (puff, response) pair if puff is None.
+        """
+        with self.lock:
+            if puff is None: return (self.expectPuff, self.responseEpc)
+            return self.responseEpc if self.expectPuff == puff else None
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class SignSessionTable(object):
+    """ Table of the active sign sessions, the sessions not active for more
+        than idleTimeout seconds are reset and removed.
+    """
+    def __init__(self, idleTimeout=SESSION_TIMEOUT, maxSessions=SESSION_MAX):
+        self.idleTimeout = idleTimeout
+        self.maxSessions = maxSessions
+        self.sessions = OrderedDict() # sid -> session, least recent active first.
+        self.sidCount = itertools.count(1)
+        self.lock = threading.Lock()
+
+#--SignSessionTable------------------------------------------------------------
+    def create(self, addr=None, closeConn=None):
+        """ Create a session for a new connection, return None if the table is
+            full. closeConn: called to close the connection when the session
+            is evicted.
+        """
+        self.evictIdle()
+        with self.lock:
+            if len(self.sessions) >= self.maxSessions:
+                print("Session: The session number reach the limit <%s>." % str(self.maxSessions))
+                return None
+            session = SignSession(next(self.sidCount), addr, closeConn)
+            self.sessions[session.sid] = session
+            return session
+
+#--SignSessionTable------------------------------------------------------------
+    def touch(self, session):
+        """ Mark the session active, return False if it has been evicted."""
+        with self.lock:
+            if session.sid not in self.sessions: return False
+            session.lastActive = time.monotonic()
+            self.sessions.move_to_end(session.sid)
+            return True
+
+#--SignSessionTable------------------------------------------------------------
+    def remove(self, session):
+        """ Remove the session when the connection is closed."""
+        with self.lock:
+            self.sessions.pop(session.sid, None)
+
+#--SignSessionTable------------------------------------------------------------
+    def evictIdle(self):
+        """ Reset and remove all the idle sessions and close their connections
+            (the connection handlers exit), return the evicted count.
+        """
+        deadline, evicted = time.monotonic() - self.idleTimeout, []
+        with self.lock:
+            while self.sessions:
+                session = next(iter(self.sessions.values()))
+                if session.lastActive > deadline: break
+                self.sessions.popitem(last=False)
+                session.reset()
+                evicted.append(session)
+        for session in evicted:
+            if session.closeConn is None: continue
+            try:
+                session.closeConn()
+            except Exception as e:
+                print("Session: close session <%s> connection error: <%s>." %(str(session.sid), str(e)))
+        if evicted: print("Session: <%s> idle sessions evicted." % str(len(evicted)))
+        return len(evicted)
+
+#--SignSessionTable------------------------------------------------------------
+    def __len__(self):
+        return len(self.sessions)
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+def testCase():
+    print("Start sign session test.")
+    table = SignSessionTable(idleTimeout=0.1, maxSessions=2)
+    closed = []
+    ses1, ses2 = table.create(closeConn=lambda: closed.append(1)), table.create()
+    ses1.loginUser = 'user'
+    if table.create() is None and len(table) == 2:
+        print("Session limit test pass.")
+    else:
+        print("Session limit test fail.")
+    time.sleep(0.2)
+    table.touch(ses2)
+    if table.evictIdle() == 1 and ses1.loginUser is None and not table.touch(ses1) \
+        and closed == [1]:
+        print("Session idle eviction test pass.")
+    else:
+        print("Session idle eviction test fail.")
+    ses2.setExpect(1, 'swatt1')
+    if ses2.getExpect(1) == 'swatt1' and ses2.getExpect(2) is None and \
+        ses2.getExpect() == (1, 'swatt1'):
+        print("Session expected response test pass.")
+    else:
+        print("Session expected response test fail.")
+
+if __name__ == '__main__':
+    testCase()
@@ -22,6 +22,7 @@ import json
 import socket
 import hashlib
 import platform
+import itertools
 import chilkat # need to download this lib.
 
 import IOT_Att as SWATT
@@ -31,8 +32,8 @@ import firmwGlobal as gv
 
 from functools import partial
 from datetime import datetime
-from OpenSSL import crypto
-from Constants import BUFFER_SIZE, SWATT_ITER
+from OpenSSL import SSL, crypto
+from Constants import SWATT_ITER, SWATT_DIGEST
 
 SENSOR_ID   = 203   # default sernsor ID for test.
 SIGNER_ID   = 154946511204681   # default signer user ID.
@@ -49,7 +50,10 @@ class FirmwareSignTool(wx.Frame):
         self.SetBackgroundColour(wx.Colour(200, 210, 200))
         # Init parameters here:
         self.sslClient = SSLC.TLS_sslClient(self)   # changed to ssl client.
-        self.msgMgr= firmwMsgMgr.msgMgr(self) # create the message manager.
+        self.msgMgr= firmwMsgMgr.msgMgr(self, framing=True) # create the message manager.
+        self.frameReader = None # message frame reader of the connection.
+        self.ridCount = itertools.count(1) # request ID generator.
+        self.replies = {}       # received replies not taken yet: rid -> reply.
         self.saveCert = True    # flag to specify whether we save certificate in local.
         self.bIOhandler = None  # ByteIO used to save the certificate in memory.
         self.ownRandom = None   # login random1
@@ -57,7 +61,7 @@ class FirmwareSignTool(wx.Frame):
         self.priv_key = None    # sign private key.
         self.firmwarePath = gv.DEFUALT_FW
         # Init the SWATT calculator. 
-        self.swattHd = SWATT.swattCal()
+        self.swattHd = SWATT.swattCal(digestVer=SWATT_DIGEST)
         self.swattChaStr = 'Default Challenge String' 
         # Create the RSA encrypter(currently not use as we switch to new design)
         self.rsaEncryptor = chilkat.CkRsa()
@@ -157,26 +161,19 @@ class FirmwareSignTool(wx.Frame):
 
 #--FirmwareSignTool------------------------------------------------------------
     def connectToServer(self, event):
-        """ Connect to the server(ip, port) based on user's selection. """
+        """ Connect to the server(ip, port) based on user's selection. The 
+            connection request is sent together with the login request.
+        """
         ServerName = self.serverchoice.GetString(
             self.serverchoice.GetSelection())
         ip, port = gv.SI_SERVER_CHOICE[ServerName]
         try:
             self.sslClient.connect((ip, port))
-            # Connect to server.
-            connectRequest = self.msgMgr.dumpMsg(action='CR')
-            self.sslClient.send(connectRequest)
-            response = self.sslClient.recv(BUFFER_SIZE)                
-            dataDict = self.msgMgr.loadMsg(response)
-            if dataDict['act'] == 'HB' and dataDict['lAct'] == 'CR':
-                if dataDict['state']:
-                    self.lgLb.SetLabel('Login [ %s ]' %ServerName)
-                    self.hideWidgets(hide=False)
-                    self.SetStatusText("Connection: connected.")
-                else:
-                    print("Connection: connection denied.")
-            else:
-                print("Connection: connect fail.")
+            self.frameReader = firmwMsgMgr.frameReader(self.sslClient.recv)
+            self.replies.clear()
+            self.lgLb.SetLabel('Login [ %s ]' %ServerName)
+            self.hideWidgets(hide=False)
+            self.SetStatusText("Connection: connected.")
         except:
             print("Connection: TCP connection fault.")
             self.sslClient = None
@@ -184,10 +181,10 @@ class FirmwareSignTool(wx.Frame):
 #--FirmwareSignTool------------------------------------------------------------
     def fetchKeyFromServer(self):
         """ Send the private key file fetch request. """
-        self.sslClient.send(self.msgMgr.dumpMsg(action='CF'))
-        # Assume the sign certificate file is not more than 4K bytes.
-        response = self.sslClient.recv(BUFFER_SIZE*4) 
-        data = self.msgMgr.loadMsg(response)
+        data = self.getReply(self.sendRequest('CF'), fileReply=True)
+        if not isinstance(data, bytes):
+            print("Fetch the certificate file from the server failed.")
+            return
         if self.saveCert:
             with open(gv.RECV_PRIK_PATH, "wb") as fh:
                 fh.write(data)
@@ -205,6 +202,31 @@ class FirmwareSignTool(wx.Frame):
         encryptedStr = self.rsaEncryptor.encryptStringENC(dataStr, usePrivateKey)
         return encryptedStr
 
+#--FirmwareSignTool------------------------------------------------------------
+    def getReply(self, rid, fileReply=False):
+        """ Wait for the reply of the request ID(the replies may come out of 
+            order). fileReply: the request is answered by a file message(no 
+            request ID) or by a HB with the request ID if failed. Return None 
+            if the connection is closed or the server rejected the connection
+            (HB without request ID).
+        """
+        while rid not in self.replies and not (fileReply and None in self.replies):
+            try:
+                response = self.frameReader.readFrame()
+            except (SSL.Error, OSError) as err:
+                print("Connection: connection closed: <%s>." % str(err))
+                response = None
+            if response is None: return None
+            dataDict = self.msgMgr.loadMsg(response)
+            if not isinstance(dataDict, dict):
+                self.replies[None] = dataDict  # file message.
+            elif dataDict.get('rid') is None and dataDict.get('act') == 'HB':
+                print("Connection: request <%s> rejected." % str(dataDict.get('lAct')))
+                return None
+            else:
+                self.replies[dataDict.get('rid')] = dataDict
+        return self.replies.pop(rid if rid in self.replies else None)
+
 #--FirmwareSignTool------------------------------------------------------------
     def getMD5Hash(self, fname):
         """ Get the input file's MD5 hash value.""" 
@@ -256,12 +278,17 @@ class FirmwareSignTool(wx.Frame):
         """ Login the firmware sign server. """
         if self.sslClient is None: return
         user, pwd = self.userFI.GetLineText(0), self.pwdFI.GetLineText(0)
-        # Send the username and randome to server.
-        datab, self.ownRandom = self.msgMgr.dumpMsg(
-            action='LI1', dataArgs=user)
-        self.sslClient.send(datab)
-        response = self.sslClient.recv(BUFFER_SIZE)
-        dataDict = self.msgMgr.loadMsg(response)
+        # Send the connection request together with the username and randome.
+        crRid = self.sendRequest('CR')
+        liRid, self.ownRandom = self.sendRequest('LI1', dataArgs=user)
+        dataDict = self.getReply(crRid)
+        if not (dataDict and dataDict['act'] == 'HB' and dataDict['lAct'] == 'CR' and dataDict['state']):
+            print("Connection: connection denied.")
+            return
+        dataDict = self.getReply(liRid)
+        if dataDict is None:
+            print("Connection: connect fail.")
+            return
         if dataDict['act'] == 'HB':
             if dataDict['lAct'] == 'LI1' and not dataDict['state']:
                 print("Login: the user is not exist.")
@@ -269,12 +296,9 @@ class FirmwareSignTool(wx.Frame):
         elif dataDict['act'] == 'LR1':
             if dataDict['state']:
                 if bytes.fromhex(dataDict['random1']) == self.ownRandom:
-                    datab = self.msgMgr.dumpMsg(
-                        action='LI2', dataArgs=(dataDict['random2'], pwd))
-                    self.sslClient.send(datab)
-                    response = self.sslClient.recv(BUFFER_SIZE)
-                    dataDict = self.msgMgr.loadMsg(response)
-                    if dataDict['act'] == 'LR2':
+                    dataDict = self.getReply(self.sendRequest(
+                        'LI2', dataArgs=(dataDict['random2'], pwd)))
+                    if dataDict and dataDict['act'] == 'LR2':
                         self.swattChaStr = dataDict['challenge']
                         self.signBt.Enable(True)
                         self.statusbar.SetStatusText(
@@ -297,30 +321,81 @@ class FirmwareSignTool(wx.Frame):
         self.signBt.Enable(False)
         self.hideWidgets(hide=True)
         
+#--FirmwareSignTool------------------------------------------------------------
+    def sendRequest(self, action, dataArgs=None):
+        """ Send a request with a new request ID without waiting for the reply,
+            return the request ID.(LI1 returns (request ID, random1 bytes))
+        """
+        rid = next(self.ridCount)
+        datab = self.msgMgr.dumpMsg(action=action, dataArgs=dataArgs, rid=rid)
+        if isinstance(datab, tuple):
+            self.sslClient.send(datab[0])
+            return (rid, datab[1])
+        self.sslClient.send(datab)
+        return rid
+
 #--FirmwareSignTool------------------------------------------------------------
     def signFirmware(self, event):
         """ Sign the firmware file and send the data to server.(use SSL commmunication 
             private key to sign the data string.)
         """
+        self.signSensors([SENSOR_ID])
+
+#--FirmwareSignTool------------------------------------------------------------
+    def signSensors(self, sensorIds):
+        """ Sign the firmware for each sensor in the sensorIds list. All the sign
+            requests are sent before waiting for the replies, return the signed
+            sensor count.
+        """
         print("FirmwSign: starting sign the firmware")
         #self.loadCert()
         self.loadPrivateKey(gv.CSSL_PRIK_PATH)
-        sensor_id, signer_id = str(SENSOR_ID), str(SIGNER_ID)
+        signer_id = str(SIGNER_ID)
         self.swattHd.setPuff(SIGNER_ID)
         swatt_str = self.getSWATThash(self.firmwarePath)
-        date_str = str(time.time()) #str(datetime.now())
         sensor_type, version = 'XKAK_PPL_COUNT', '30015.0'
-        combinStr = ''.join([sensor_id, signer_id, swatt_str, date_str, sensor_type, version])
-        #signature = self.getEncryptedStr(combinStr)
-        signature = crypto.sign(self.priv_key, combinStr.encode('utf-8'), 'sha256')
-        datab = self.msgMgr.dumpMsg(action='SR', dataArgs=(SENSOR_ID, SIGNER_ID, swatt_str, date_str, sensor_type, version, signature))
-        self.sslClient.send(datab)
-        response = self.sslClient.recv(BUFFER_SIZE)
-        dataDict = self.msgMgr.loadMsg(response)
-        if dataDict['act'] == 'HB' and dataDict['lAct'] and dataDict['state']:
-            print("FirmwSign: The firmware is signed successfully.")
-        else:
-            print("FirmwSign: The firmware siganture is out of date.")
+        rids = []
+        for sensorId in sensorIds:
+            date_str = str(time.time()) #str(datetime.now())
+            combinStr = ''.join([str(sensorId), signer_id, swatt_str, date_str, sensor_type, version])
+            #signature = self.getEncryptedStr(combinStr)
+            signature = crypto.sign(self.priv_key, combinStr.encode('utf-8'), 'sha256')
+            rids.append(self.sendRequest('SR', dataArgs=(
+                sensorId, SIGNER_ID, swatt_str, date_str, sensor_type, version, signature)))
+        count = 0
+        for sensorId, rid in zip(sensorIds, rids):
+            dataDict = self.getReply(rid)
+            if dataDict and dataDict['act'] == 'HB' and dataDict['lAct'] and dataDict['state']:
+                print("FirmwSign: The firmware is signed successfully for sensor <%s>." %str(sensorId))
+                count += 1
+            else:
+                print("FirmwSign: The firmware siganture is out of date for sensor <%s>." %str(sensorId))
+        return count
+
+#--FirmwareSignTool------------------------------------------------------------
+    def signSensorsBulk(self, sensorIds):
+        """ Sign the firmware for all the sensors in the sensorIds list with one
+            bulk sign request, return the server signature list(0 for the 
+            sensor not signed).
+        """
+        print("FirmwSign: starting bulk sign the firmware")
+        self.loadPrivateKey(gv.CSSL_PRIK_PATH)
+        signer_id = str(SIGNER_ID)
+        self.swattHd.setPuff(SIGNER_ID)
+        swatt_str = self.getSWATThash(self.firmwarePath)
+        sensor_type, version = 'XKAK_PPL_COUNT', '30015.0'
+        entries = []
+        for sensorId in sensorIds:
+            date_str = str(time.time())
+            combinStr = ''.join([str(sensorId), signer_id, swatt_str, date_str, sensor_type, version])
+            signature = crypto.sign(self.priv_key, combinStr.encode('utf-8'), 'sha256')
+            entries.append((sensorId, SIGNER_ID, swatt_str, date_str, sensor_type, version, signature))
+        dataDict = self.getReply(self.sendRequest('SB', dataArgs=entries))
+        if dataDict is None or dataDict['act'] != 'BR':
+            print("FirmwSign: The bulk sign request is rejected.")
+            return [0]*len(sensorIds)
+        print("FirmwSign: <%s/%s> sensors signed." %(str(len(sensorIds)-dataDict['signs'].count(0)), str(len(sensorIds))))
+        return dataDict['signs']
 
 #--FirmwareSignTool------------------------------------------------------------
     def signFirmware_notinused(self, event):
@@ -341,7 +416,7 @@ class FirmwareSignTool(wx.Frame):
         signature = crypto.sign(self.priv_key, combinStr.encode('utf-8'), 'sha256')
         datab = self.msgMgr.dumpMsg(action='SR', dataArgs=(SENSOR_ID, SIGNER_ID,swatt_str, date_str, sensor_type, version, signature))
         self.sslClient.send(datab)
-        response = self.sslClient.recv(BUFFER_SIZE)
+        response = self.frameReader.readFrame()
         dataDict = self.msgMgr.loadMsg(response)
         if dataDict['act'] == 'HB' and dataDict['lAct']:
             print("FirmwSign: The firmware is signed successfully.")
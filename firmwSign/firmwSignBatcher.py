@@ -0,0 +1,199 @@
+#!/usr/bin/python
+#-----------------------------------------------------------------------------
+# Name:        firmwSignBatcher.py
+#
+# Purpose:     This module is used to create a sign batcher thread which
+#              collects the verified firmware sign records over a short window
+#              (SIGN_BATCH_WINDOW seconds or SIGN_BATCH_SIZE records), signs
+#              them with the server private key and saves them to the data
+#              base in one transaction. Every record's submitter waits on its
+#              own future for the server signature.
+# Author:      Yuancheng Liu
+#
+# Created:     2019/10/13
+# Copyright:   NUS – Singtel Cyber Security Research & Development Laboratory
+# License:     YC @ NUS
+#-----------------------------------------------------------------------------
+import time
+import queue
+import threading
+import concurrent.futures
+from OpenSSL import crypto
+import firmwGlobal as gv
+from Constants import SIGN_BATCH_WINDOW, SIGN_BATCH_SIZE, SIGN_BATCH_TIMEOUT
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class signBatcher(threading.Thread):
+    """ Thread to sign and save the firmware sign records in batches. submit()
+        returns a concurrent.futures.Future of the server signature(bytes, or
+        None if the record can not be signed/saved).
+    """
+    def __init__(self, keyStore, dbMgr, keyPath=gv.SIGN_PRIV_PATH,
+                 window=SIGN_BATCH_WINDOW, batchSize=SIGN_BATCH_SIZE):
+        threading.Thread.__init__(self)
+        self.name = "Sign_batcher"
+        self.daemon = True
+        self.keyStore = keyStore    # key store to get the sign private key.
+        self.dbMgr = dbMgr          # data base manager to save the records.
+        self.keyPath = keyPath
+        self.window = window
+        self.batchSize = batchSize
+        self.queue = queue.Queue()  # (record list, future), None to stop.
+        self.terminate = False
+
+#--signBatcher-----------------------------------------------------------------
+    def submit(self, rcdList):
+        """ Add a sign record(the 9 firmwareInfo fields before the server
+            signature) to the next batch, return the signature future.
+        """
+        future = concurrent.futures.Future()
+        self.queue.put((rcdList, future))
+        return future
+
+#--signBatcher-----------------------------------------------------------------
+    def sign(self, rcdList, timeout=SIGN_BATCH_TIMEOUT):
+        """ Submit the record and wait for the server signature, return None
+            if the record is not signed in time(the record is cancelled and
+            will not be saved).
+        """
+        return self.signAll([rcdList], timeout=timeout)[0]
+
+#--signBatcher-----------------------------------------------------------------
+    def signAll(self, rcdLists, timeout=SIGN_BATCH_TIMEOUT):
+        """ Submit all the records and wait for their server signatures, return
+            the signature list(None for the record not signed in time). The
+            timeout records are cancelled so the batcher doesn't save them, a
+            record already being signed can't be cancelled and its result is
+            waited for another timeout seconds.
+        """
+        futures = [self.submit(rcdList) for rcdList in rcdLists]
+        _, notDone = concurrent.futures.wait(futures, timeout=timeout)
+        if notDone:
+            print("SignBatcher: Sign record time out.")
+            for future in notDone: future.cancel()
+            concurrent.futures.wait(notDone, timeout=timeout)
+        signatures = []
+        for future in futures:
+            if future.done() and not future.cancelled():
+                signatures.append(future.result())
+            else:
+                signatures.append(None)
+        return signatures
+
+#--signBatcher-----------------------------------------------------------------
+    def run(self):
+        """ Collect the records until the window is over or the batch is full,
+            then sign and save them.
+        """
+        while not self.terminate:
+            item = self.queue.get()
+            if item is None: break
+            batch, deadline = [item], time.monotonic() + self.window
+            while len(batch) < self.batchSize:
+                timeLeft = deadline - time.monotonic()
+                if timeLeft <= 0: break
+                try:
+                    item = self.queue.get(timeout=timeLeft)
+                except queue.Empty:
+                    break
+                if item is None:
+                    self.terminate = True
+                    break
+                batch.append(item)
+            try:
+                self._signBatch(batch)
+            except Exception as e:
+                print("SignBatcher: Sign batch failed, exception: <%s>." % str(e))
+                # Don't leave the submitters waiting for the failed batch.
+                for _, future in batch:
+                    if not future.done() and (future.running() or future.set_running_or_notify_cancel()):
+                        future.set_result(None)
+
+#--signBatcher-----------------------------------------------------------------
+    def stop(self):
+        """ Stop the batcher thread after the current batch."""
+        self.terminate = True
+        self.queue.put(None)
+
+#--signBatcher-----------------------------------------------------------------
+    def _signBatch(self, batch):
+        """ Sign all the records of the batch, save them in one transaction and
+            set every record's future result.
+        """
+        privKey = self.keyStore.getPrivateKey(self.keyPath)
+        rows, signed = [], []
+        for rcdList, future in batch:
+            if not future.set_running_or_notify_cancel(): continue
+            try:
+                dataStr = ''.join([str(n) for n in rcdList]).encode('utf-8')
+                signature = crypto.sign(privKey, dataStr, 'sha256')
+            except Exception as e:
+                print("SignBatcher: Sign record failed, exception: <%s>." % str(e))
+                future.set_result(None)
+                continue
+            rows.append(list(rcdList) + [signature.hex()])
+            signed.append((future, signature))
+        if not signed: return
+        saved = self.dbMgr.createFmSignRcds(rows)
+        for future, signature in signed:
+            future.set_result(signature if saved else None)
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+def testCase():
+    import firmwKeyStore as KEYS
+    class dbStub(object):
+        """ Record the saved batches instead of writing the data base."""
+        def __init__(self): self.batches = []
+        def createFmSignRcds(self, rows):
+            self.batches.append(rows)
+            return len(rows)
+    dbMgr = dbStub()
+    batcher = signBatcher(KEYS.firmwKeyStore(), dbMgr)
+    batcher.start()
+    print("Start sign batcher test.")
+    rcd = [1, 2, 'challenge', '0x1234', '2019-10-13', 'XAKA', '1.0', gv.SIGN_CERT_PATH, 'ab']
+    futures = [batcher.submit(rcd) for _ in range(10)]
+    results = [future.result(timeout=SIGN_BATCH_TIMEOUT) for future in futures]
+    if all(results) and len(dbMgr.batches) == 1 and len(dbMgr.batches[0]) == 10:
+        print("Sign batcher test pass.")
+    else:
+        print("Sign batcher test fail.")
+    batcher.stop()
+    # A record timeout before signed is cancelled and not saved.
+    class slowKeyStore(object):
+        def getPrivateKey(self, keyPath):
+            time.sleep(0.2)
+            return KEYS.firmwKeyStore().getPrivateKey(keyPath)
+    dbMgr = dbStub()
+    batcher = signBatcher(slowKeyStore(), dbMgr, window=0)
+    batcher.start()
+    batcher.submit(rcd)
+    time.sleep(0.05) # the first batch is being signed.
+    result = batcher.sign(rcd[:-1] + ['cd'], timeout=0.05)
+    time.sleep(0.5)
+    if result is None and len(dbMgr.batches) == 1 and dbMgr.batches[0][0][8] == 'ab':
+        print("Sign batcher timeout cancel test pass.")
+    else:
+        print("Sign batcher timeout cancel test fail.")
+    batcher.stop()
+    # A failed batch returns None to its records and the batcher keeps running.
+    class failDbStub(dbStub):
+        def createFmSignRcds(self, rows):
+            if not self.batches: 
+                self.batches.append(None)
+                raise RuntimeError("data base error")
+            return dbStub.createFmSignRcds(self, rows)
+    dbMgr = failDbStub()
+    batcher = signBatcher(KEYS.firmwKeyStore(), dbMgr, window=0)
+    batcher.start()
+    results = [batcher.sign(rcd, timeout=1), batcher.sign(rcd, timeout=1)]
+    if results[0] is None and results[1] and batcher.is_alive():
+        print("Sign batcher failed batch test pass.")
+    else:
+        print("Sign batcher failed batch test fail.")
+    batcher.stop()
+
+if __name__ == '__main__':
+    testCase()
@@ -14,46 +14,106 @@
 import os
 import sys
 import json
+import time
 import string
+import queue
 import socket
+import select
+import asyncio
 import chilkat
 import threading
+import concurrent.futures
 import IOT_Att as SWATT
 import firmwDBMgr as DataBase
 import firmwMsgMgr
 import firmwTLSserver as SSLS
 import firmwTAServer as TAS
+import firmwSwattPool as SWPOOL
+import firmwChallPool as CHPOOL
+import firmwAioServer as AIOS
+import firmwSession as SESS
+import firmwKeyStore as KEYS
+import firmwSignBatcher as SIGNB
+import firmwRgServer as RGS
+import firmwLifecycle as LC
 import firmwGlobal as gv
-from OpenSSL import crypto
-from Constants import BUFFER_SIZE, SWATT_ITER
+from OpenSSL import SSL, crypto
+from Constants import BUFFER_SIZE, SWATT_ITER, CHALL_LEN, SERV_WORKERS, SERV_QUEUE
+from Constants import SERV_REQ_WORKERS, SERV_INFLIGHT, SIGN_BULK_MAX
+from Constants import SERV_DRAIN_TIMEOUT, SIGN_BATCH_TIMEOUT, SERV_REJECT_WORKERS
+from Constants import SERV_REJECT_TIMEOUT, SERV_REJECT_MAX, SESSION_TIMEOUT
 
 #-----------------------------------------------------------------------------
 #-----------------------------------------------------------------------------
 class FirmwServ(object):
     """ Main firmware sign authorization server program. """
-    def __init__(self):
-        """ Init the parameters."""
+    def __init__(self, aio=False, workers=SERV_WORKERS, queueSize=SERV_QUEUE):
+        """ Init the parameters. aio: use the asyncio server mode(startAioServer)
+            instead of the blocking server loop(startServer). workers: handler
+            thread number of startServer(), queueSize: accepted connections can
+            wait for a free handler, the others are rejected.
+        """
         self.cert = None
-        self.loginUser = None
-        self.ownRandom = None
         self.priv_key = None
-        self.responseEpc = None # expect response of the firmware file.
-        self.ranStr = "" # random string used for Swatt challenge set.
+        # PEM key/certificate cache(reload if the file changed).
+        self.keyStore = KEYS.firmwKeyStore()
+        # Login and SWATT state of each connection(SignSession).
+        self.sessions = SESS.SignSessionTable()
         #self.rsaDecryptor = self.initDecoder(Mode='RSA')
-        self.sslServer = SSLS.TLS_sslServer(self) # changed to ssl client
-        self.sslServer.serverSet(port=gv.SITCP_PORT, listen=1, block=1)
-        # Init the communication server.
-        self.tcpServer = self.initTCPServ() if self.sslServer is None else self.sslServer
+        self.terminate = False  # stop accepting the new connections.
+        self.activeConns = set() # connections served by the handler threads.
+        self.connLock = threading.Lock()
+        self.aioServer = None
+        if aio:
+            # The asyncio server creates its own listening socket.
+            self.sslServer = self.tcpServer = None
+        else:
+            self.sslServer = SSLS.TLS_sslServer(self) # changed to ssl client
+            self.sslServer.serverSet(port=gv.SITCP_PORT, listen=queueSize+1, block=1,
+                                     fd=LC.inheritedFd('sign'))
+            # Init the communication server.
+            self.tcpServer = self.initTCPServ() if self.sslServer is None else self.sslServer
         # Init the sign cert verifier.
         self.initVerifier() 
         # Init the SWA-TT calculator. 
         self.swattHd =  SWATT.swattCal()
+        # Init the SWA-TT verification worker pool.
+        self.swattPool = SWPOOL.swattPool(imagePaths=[gv.DEFUALT_FW])
+        # Init the precomputed SWA-TT challenge pool.
+        self.challPool = CHPOOL.swattChallPool(self.swattPool)
+        self.challPool.addTarget(gv.DEFUALT_FW, gv.SIGNER_PUFF)
+        self.challPool.start()
+        # Init the connection handler thread pool.
+        self.handlerPool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="SignHandler")
+        self.connSlots = threading.BoundedSemaphore(workers + queueSize)
+        # Thread pool to reject the connections when all the handlers are busy
+        # (the TLS handshake of the reject is not done by the accept thread).
+        self.rejectPool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=SERV_REJECT_WORKERS, thread_name_prefix="SignReject")
+        self.rejectSlots = threading.BoundedSemaphore(SERV_REJECT_MAX)
+        # Thread pool to run the in-flight(pipelined) sign requests.
+        self.requestPool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=SERV_REQ_WORKERS, thread_name_prefix="SignRequest")
+        # Message handlers registry: action -> handler(sender, dataDict, session).
+        self.handlers = {
+            'CR'    : self.handleConnection,
+            'LI1'   : self.handleLogin,
+            'LI2'   : self.handleAuthrozie,
+            'CF'    : self.handleCertFetch,
+            'SR'    : self.handleSignResp,
+            'SB'    : self.handleBulkSign,
+            'LO'    : self.handleLogout
+        }
         # Init the communication message manager. 
-        self.msgMgr= firmwMsgMgr.msgMgr(self) # create the message manager.
+        self.msgMgr= firmwMsgMgr.msgMgr(self, framing=True) # create the message manager.
         # Init the database manager. 
         self.dbMgr = DataBase.firmwDBMgr()
-        # Init the sensor register thread
-        self.rgThread = rgCommThread(1, "RG_response_thread", self.dbMgr)
+        # Init the sign record batcher.
+        self.signBatcher = SIGNB.signBatcher(self.keyStore, self.dbMgr)
+        self.signBatcher.start()
+        # Init the sensor register server thread
+        self.rgThread = RGS.rgSelectServer(self.dbMgr, fd=LC.inheritedFd('rg'))
         self.rgThread.start()
         # Init the trustClient Server
         #self.taThread = taCommThread(2, "TA_server_thread")
@@ -65,111 +125,159 @@ class FirmwServ(object):
         return self.dbMgr.authorizeUser(userName, password)
 
 #--FirmwServ-------------------------------------------------------------------
-    def handleAuthrozie(self, sender, dataDict):
+    def handleAuthrozie(self, sender, dataDict, ses):
         """ Authrozie the user feed back random 2 value and password. Send the 
             Swatt challenge string if password is verified.
         """
-        reply = None 
-        if bytes.fromhex(dataDict['random2']) == self.ownRandom and \
-            self.dbMgr.authorizeUser(self.loginUser, dataDict['password']):
+        reply = None
+        if bytes.fromhex(dataDict['random2']) == ses.ownRandom and \
+            self.dbMgr.authorizeUser(ses.loginUser, dataDict['password']):
             print("Login2: User login password correct.")
-            self.ranStr = self.swattHd.randomChallStr(stringLength=10)
-            reply = self.msgMgr.dumpMsg(action='LR2', dataArgs=self.ranStr)
+            # Use a precomputed challenge if there is one ready.
+            pair = self.challPool.popPair(gv.DEFUALT_FW, gv.SIGNER_PUFF)
+            if pair:
+                ses.ranStr = pair[0]
+                ses.setExpect(gv.SIGNER_PUFF, pair[1])
+            else:
+                ses.ranStr = self.swattHd.randomChallStr(stringLength=CHALL_LEN)
+                ses.setExpect(None, None)
+            reply = self.msgMgr.dumpMsg(action='LR2', dataArgs=ses.ranStr, rid=dataDict.get('rid'))
         else:
             print("Login2: User password incorrect.")
             # feed back user login fail if the password is incorrect.
-            reply = self.msgMgr.dumpMsg(action='HB', dataArgs=('LI2', 0))
+            reply = self.msgMgr.dumpMsg(action='HB', dataArgs=('LI2', 0), rid=dataDict.get('rid'))
         sender.send(reply)
 
 #--FirmwServ-------------------------------------------------------------------
-    def handleCertFetch(self, sender, dataDict):
+    def handleBulkSign(self, sender, dataDict, ses):
+        """ Verify and sign all the sign entries of one firmware in the bulk 
+            sign request, the SWATT is verified once for each signer PUFF.
+            Reply the server signature list(0 for the entry not signed).
+        """
+        entries, rid = dataDict.get('entries') or [], dataDict.get('rid')
+        if not isinstance(entries, list) or not entries or len(entries) > SIGN_BULK_MAX:
+            print("SignVerify: The bulk sign entry list is empty or over the limit.")
+            sender.send(self.msgMgr.dumpMsg(action='HB', dataArgs=('SB', 0), rid=rid))
+            return False
+        verified = [self.verifyClientSign(entry) for entry in entries]
+        # Calculate the expected SWATT of the signer PUFFs not precomputed.
+        expectPuff, responseEpc = ses.getExpect()
+        expects = {expectPuff: responseEpc} if responseEpc else {}
+        puffs = sorted({int(entry['sid']) for entry, ok in zip(entries, verified) if ok} - set(expects))
+        if puffs:
+            results = self.swattPool.getResult(self.swattPool.submitBatch(
+                [ses.ranStr]*len(puffs), puffs, SWATT_ITER, gv.DEFUALT_FW))
+            if results: expects.update(zip(puffs, results))
+        signIdx, rcdLists = [], []
+        for idx, (entry, ok) in enumerate(zip(entries, verified)):
+            if ok and expects.get(int(entry['sid'])) == entry['swatt']:
+                signIdx.append(idx)
+                rcdLists.append(self.buildSignRcd(entry, ses))
+        signatures = [0]*len(entries)
+        for idx, signature in zip(signIdx, self.signBatcher.signAll(rcdLists)):
+            if signature: signatures[idx] = signature
+        print("SignVerify: <%s/%s> bulk sign entries signed." %(str(len(entries)-signatures.count(0)), str(len(entries))))
+        sender.send(self.msgMgr.dumpMsg(action='BR', dataArgs=signatures, rid=rid))
+
+#--FirmwServ-------------------------------------------------------------------
+    def handleCertFetch(self, sender, dataDict, ses=None):
         """ Handle the certificate fetch request."""
-        f_send, reply = gv.SIGN_PRIV_PATH, None
-        with open(f_send, "rb") as f:
-            reply = self.msgMgr.dumpMsg(action='FL', dataArgs=f.read())
+        raw = self.keyStore.getRaw(gv.SIGN_PRIV_PATH)
+        reply = self.msgMgr.dumpMsg(action='FL', dataArgs=raw) if raw else \
+            self.msgMgr.dumpMsg(action='HB', dataArgs=('CF', 0), rid=dataDict.get('rid'))
         sender.send(reply)
 
 #--FirmwServ-------------------------------------------------------------------
-    def handleConnection(self, sender, dataDict):
+    def handleConnection(self, sender, dataDict, ses=None):
         """ Handle the client connection request."""
-        reply = self.msgMgr.dumpMsg(action='HB', dataArgs=('CR', 1))
+        reply = self.msgMgr.dumpMsg(action='HB', dataArgs=('CR', 1), rid=dataDict.get('rid'))
         sender.send(reply)
 
 #--FirmwServ-------------------------------------------------------------------
-    def handleLogin(self, sender, dataDict):
+    def handleLogin(self, sender, dataDict, ses):
         """ Handle the user login request.(check whether the user is in data base
             and create the authorization random2)
         """
-        self.loginUser, reply = dataDict['user'], None 
-        if self.dbMgr.checkUser(self.loginUser):
-            print("Login 1: find the user<%s>." %self.loginUser)
-            reply, self.ownRandom = self.msgMgr.dumpMsg(action='LR1',dataArgs=(dataDict['random1'], 1))
+        ses.loginUser, reply = dataDict['user'], None 
+        if self.dbMgr.checkUser(ses.loginUser):
+            print("Login 1: find the user<%s>." %ses.loginUser)
+            reply, ses.ownRandom = self.msgMgr.dumpMsg(action='LR1',dataArgs=(dataDict['random1'], 1), rid=dataDict.get('rid'))
+        else:
+            print("Login 1: the user<%s> is not in data base." %str(ses.loginUser))
+            ses.loginUser = None
+            reply = self.msgMgr.dumpMsg(action='HB',dataArgs=('LI1', 0), rid=dataDict.get('rid'))
+        sender.send(reply)
+
+#--FirmwServ-------------------------------------------------------------------
+    def handleLogout(self, sender, dataDict, ses):
+        """ Handle user logout: clear all the parameters of the session."""
+        ses.reset()
+        self.sessions.remove(ses)
+
+#--FirmwServ-------------------------------------------------------------------
+    def handleSignResp(self, sender, dataDict, ses, responseEpc=None):
+        """ Parse the sign feed back message and verify the sign correction.
+            responseEpc: expected SWATT response calculated by the caller.
+        """
+        reply = None
+        if not self.verifyClientSign(dataDict):
+            sender.send(self.msgMgr.dumpMsg(action='HB', dataArgs=('SR', 0), rid=dataDict.get('rid')))
+            return False
+
+        # Double confirm the SWATT(only calculate if it is not precomputed)
+        puff = int(dataDict['sid'])
+        if responseEpc is None: responseEpc = ses.getExpect(puff)
+        if responseEpc is None:
+            responseEpc = self.swattPool.getSWATT(ses.ranStr, puff, SWATT_ITER, gv.DEFUALT_FW)
+            ses.setExpect(puff, responseEpc)
+        if responseEpc is not None and dataDict['swatt'] == responseEpc:
+            print("SingVerify: the firmware is signed successfully.")
+            # Sign and save the record with the other records in the batch.
+            signatureServer = self.signBatcher.sign(self.buildSignRcd(dataDict, ses))
+            reply = self.msgMgr.dumpMsg(action='HB', dataArgs=('SR', signatureServer if signatureServer else 0), rid=dataDict.get('rid'))
         else:
-            print("Login 1: the user<%s> is not in data base." %str(self.loginUser))
-            self.loginUser = None
-            reply = self.msgMgr.dumpMsg(action='HB',dataArgs=('LI1', 0))
+            reply = self.msgMgr.dumpMsg(action='HB', dataArgs=('SR', 0), rid=dataDict.get('rid'))
         sender.send(reply)
 
 #--FirmwServ-------------------------------------------------------------------
-    def handleLogout(self):
-        """ Handle user logout: clear all the parameters"""
-        self.loginUser = None
-        self.ownRandom = None
-        self.responseEpc = None
-        self.ranStr = ""
+    def buildSignRcd(self, entry, ses):
+        """ Create the firmware sign record(without server signature) of the
+            SR/SB sign entry.
+        """
+        return [int(entry['id']), int(entry['sid']), ses.ranStr,
+                str(entry['swatt']), entry['date'], entry['tpye'],
+                entry['version'], gv.SIGN_CERT_PATH, entry['signStr']]
 
 #--FirmwServ-------------------------------------------------------------------
-    def handleSignResp(self, sender, dataDict):
-        """ Parse the sign feed back message and verify the sign correction."""
-        checkStr = ''.join([str(dataDict['id']),
-                            str(dataDict['sid']),
-                            str(dataDict['swatt']),
-                            str(dataDict['date']),
-                            str(dataDict['tpye']),
-                            str(dataDict['version'])
+    def verifyClientSign(self, entry):
+        """ Verify the signer's signature of the SR/SB sign entry."""
+        checkStr = ''.join([str(entry['id']),
+                            str(entry['sid']),
+                            str(entry['swatt']),
+                            str(entry['date']),
+                            str(entry['tpye']),
+                            str(entry['version'])
                             ])
         # Below comments part is user the old RSA sign verify method.
         #encryptedStr = dataDict['signStr']
         #print("decode the signature string")
         #usePrivateKey = True
         #decryptedStr = self.rsaDecryptor.decryptStringENC(encryptedStr,usePrivateKey)
-        sign, reply = bytes.fromhex(dataDict['signStr']), None
         try:
+            sign = bytes.fromhex(entry['signStr'])
             # <crypto.verify> return None if verify, else return exception.
-            if crypto.verify(self.cert, sign, checkStr.encode('utf-8'), 'sha256') is None:
-                print("SignVerify: The result is correct.")
+            crypto.verify(self.keyStore.getCertificate(gv.CSSL_CERT_PATH), sign, checkStr.encode('utf-8'), 'sha256')
         except:
-            print("SingVerify: The sign can not metch the data.")
-            sender.send(self.msgMgr.dumpMsg(action='SR', dataArgs=('LI1', 0)))
+            print("SingVerify: The sign can not metch the data: %s" % checkStr)
             return False
-        print("SingVerify: This is the decryptioin sstr: %s" % checkStr)
-
-        # Double confirm the SWATT
-        self.swattHd.setPuff(int(dataDict['sid']))
-        self.responseEpc = self.swattHd.getSWATT(self.ranStr, SWATT_ITER, gv.DEFUALT_FW)
-        if dataDict['swatt'] == self.responseEpc:
-            print("SingVerify: the firmware is signed successfully.")
-            rcdList = [int(dataDict['id']), int(dataDict['sid']), self.ranStr,
-                       str(dataDict['swatt']), dataDict['date'], dataDict['tpye'],
-                       dataDict['version'], gv.SIGN_CERT_PATH, dataDict['signStr']]
-            self.loadPrivateK(gv.SIGN_PRIV_PATH)
-            dataStr = ''.join([str(n) for n in rcdList]).encode('utf-8')
-            signatureServer = crypto.sign(self.priv_key, dataStr, 'sha256')
-            rcdList.append(signatureServer.hex())
-            self.dbMgr.createFmSignRcd(rcdList)
-            reply = self.msgMgr.dumpMsg(action='HB', dataArgs=('SR', signatureServer))
-        else:
-            reply = self.msgMgr.dumpMsg(action='HB', dataArgs=('SR', 0))
-        sender.send(reply)
+        return True
 
 #--FirmwServ-------------------------------------------------------------------
     def loadPrivateK(self, keyPath):
         """ Load private key from the sertificate file."""
-        if not os.path.exists(keyPath):
+        self.priv_key = self.keyStore.getPrivateKey(keyPath)
+        if self.priv_key is None:
             print("The private key file used to sign input is not exist.")
-        with open(keyPath, 'rb') as f:
-            self.priv_key = crypto.load_privatekey(
-                crypto.FILETYPE_PEM, f.read())
 
 #--FirmwServ-------------------------------------------------------------------
     def initDecoder(self, Mode=None):
@@ -212,8 +320,7 @@ class FirmwServ(object):
 #--FirmwServ-------------------------------------------------------------------
     def initVerifier(self):
         """ Init the cerfiticate verifier."""
-        with open(gv.CSSL_CERT_PATH,'rb') as f:
-            self.cert = crypto.load_certificate(crypto.FILETYPE_PEM, f.read())
+        self.cert = self.keyStore.getCertificate(gv.CSSL_CERT_PATH)
         print("Sign: Locaded the sign certificate file.")
 
 #--FirmwServ-------------------------------------------------------------------
@@ -227,98 +334,256 @@ class FirmwServ(object):
         """
         return os.urandom(stringLength).hex()
 
+#--FirmwServ-------------------------------------------------------------------
+    def rejectConnection(self, conn, timeout=SERV_REJECT_TIMEOUT):
+        """ Reply the connection request fail and close the connection when the
+            server is busy. The socket is non-blocking and the reply(with the 
+            TLS handshake) is given up after timeout seconds, so a client which
+            never finishes the handshake can't block the caller. After the 
+            reply the client data is read until it closes, as closing with the
+            unread data resets the connection and the reply may be lost.
+        """
+        data = self.msgMgr.dumpMsg(action='HB', dataArgs=('CR', 0))
+        deadline = time.monotonic() + timeout
+        try:
+            conn.setblocking(False)
+            while True:
+                try:
+                    if data:
+                        data = data[conn.send(data):]
+                        if not data: getattr(conn, 'sock_shutdown', conn.shutdown)(socket.SHUT_WR)
+                    elif not conn.recv(BUFFER_SIZE):
+                        break
+                    continue
+                except SSL.WantReadError:
+                    waitR, waitW = [conn], []
+                except (SSL.WantWriteError, BlockingIOError):
+                    waitR, waitW = ([], [conn]) if data else ([conn], [])
+                timeLeft = deadline - time.monotonic()
+                if timeLeft <= 0 or not any(select.select(waitR, waitW, [], timeLeft)[:2]):
+                    print("Connection: reject connection time out.")
+                    break
+        except (SSL.ZeroReturnError, SSL.SysCallError):
+            pass # the client closed the connection.
+        except Exception as e:
+            print("Connection: reject connection error, exception: <%s>." %str(e))
+        finally:
+            conn.close()
+
+#--FirmwServ-------------------------------------------------------------------
+    def rejectAsync(self, conn):
+        """ Reject the connection in the reject thread pool, close it directly
+            if too many connections are waiting to be rejected.
+        """
+        if not self.rejectSlots.acquire(blocking=False):
+            conn.close()
+            return
+        def reject():
+            try:
+                self.rejectConnection(conn)
+            finally:
+                self.rejectSlots.release()
+        self.rejectPool.submit(reject)
+
+#--FirmwServ-------------------------------------------------------------------
+    def serveConnection(self, conn, addr):
+        """ Serve one client connection until it logout or disconnect(run in
+            the handler thread pool).
+        """
+        session = self.sessions.create(addr, closeConn=lambda: getattr(
+            conn, 'sock_shutdown', conn.shutdown)(socket.SHUT_RDWR))
+        sender, inflight = replySender(conn), []
+        reader = firmwMsgMgr.frameReader(conn.recv, waitFunc=sender.waitRecv)
+        try:
+            if session is None:
+                self.rejectConnection(conn)
+                return
+            while True:
+                data = reader.readFrame()
+                if not data: break # get the ending message. 
+                print("Connection: received data:<%s>" %str(data))
+                if not self.sessions.touch(session):
+                    print("Connection: session <%s> idle time out." %str(session.sid))
+                    break
+                dataDict = self.msgMgr.loadMsg(data)
+                handler = self.handlers.get(dataDict['act'])
+                if handler is None: continue
+                inflight = [future for future in inflight if not future.done()]
+                if dataDict['act'] in ('SR', 'SB'):
+                    # Sign requests run in flight and reply out of order.
+                    if len(inflight) >= SERV_INFLIGHT:
+                        concurrent.futures.wait(inflight, return_when=concurrent.futures.FIRST_COMPLETED)
+                    inflight.append(self.requestPool.submit(
+                        self.runRequest, handler, sender, dataDict, session))
+                    continue
+                # The other requests change/use the session login state, wait 
+                # for the in-flight sign requests first.
+                concurrent.futures.wait(inflight)
+                handler(sender, dataDict, session)
+                sender.flush()
+                if dataDict['act'] == 'LO': break
+            concurrent.futures.wait(inflight)
+            sender.flush()
+        except socket.timeout:
+            print("Connection: session <%s> idle time out." %str(session.sid))
+        except Exception as e:
+            print("Connection: connection error, exception: <%s>." %str(e))
+        finally:
+            conn.close()
+            if session: self.sessions.remove(session)
+            with self.connLock:
+                self.activeConns.discard(conn)
+            sender.close()
+            self.connSlots.release()
+
+#--FirmwServ-------------------------------------------------------------------
+    def runRequest(self, handler, sender, dataDict, session):
+        """ Run an in-flight request handler, reply fail if it raise exception."""
+        try:
+            handler(sender, dataDict, session)
+        except Exception as e:
+            print("Connection: request <%s> error, exception: <%s>." %(dataDict['act'], str(e)))
+            sender.send(self.msgMgr.dumpMsg(action='HB', dataArgs=(dataDict['act'], 0),
+                                            rid=dataDict.get('rid')))
+
 #--FirmwServ-------------------------------------------------------------------
     def startServer(self):
-        """ main server loop to handle the user's requst. """
-        terminate = False
-        while not terminate:
+        """ main server loop to accept the user's connection, each connection 
+            is served by a thread in the handler pool.
+        """
+        listener = getattr(self.tcpServer, 'server', self.tcpServer)
+        # The listening socket may be shared with the new server process
+        # (hot restart), don't block in accept() if the other one got it.
+        listener.setblocking(False)
+        while not self.terminate:
+            # Close the idle sessions every loop(select time out 1 sec).
+            self.sessions.evictIdle()
             # Add the reconnection handling
             try:
+                # Wait with timeout to check the stop request.
+                if not select.select([listener], [], [], 1)[0] or self.terminate: continue
                 conn, addr = self.tcpServer.accept()
+                conn.setblocking(True)
                 print('Connection: connection address:<%s>' %str(addr))
-                while not terminate:
-                    data = conn.recv(BUFFER_SIZE)
-                    if not data: break # get the ending message. 
-                    print("Connection: received data:<%s>" %str(data))
-                    dataDict = self.msgMgr.loadMsg(data)
-                    if dataDict['act'] == 'CR':
-                        self.handleConnection(conn, dataDict)
-                    elif dataDict['act'] == 'LI1':
-                        self.handleLogin(conn, dataDict)
-                    elif dataDict['act'] == 'LI2':
-                        self.handleAuthrozie(conn, dataDict)
-                    elif dataDict['act'] == 'CF':
-                        self.handleCertFetch(conn, dataDict)
-                    elif dataDict['act'] == 'SR':
-                        self.handleSignResp(conn, dataDict)
-                    elif dataDict['act'] == 'LO':
-                        self.handleLogout()
-                        break
-                    else:
-                        continue
+                if not self.connSlots.acquire(blocking=False):
+                    print("Connection: all the handlers are busy, reject <%s>." %str(addr))
+                    self.rejectAsync(conn)
+                    continue
+                # Track the connection when accepted, so the shutdown also
+                # closes the ones waiting in the handler pool queue.
+                with self.connLock:
+                    self.activeConns.add(conn)
+                self.handlerPool.submit(self.serveConnection, conn, addr)
+            except BlockingIOError:
+                continue
             except Exception as e:
                 print("MainLoop: main loop error, exception: <%s>." %str(e))
                 continue
 
+#--FirmwServ-------------------------------------------------------------------
+    def startAioServer(self):
+        """ Asyncio server loop: serve all the clients concurrently, each 
+            connection has its own session.
+        """
+        self.aioServer = AIOS.firmwAioServer(self, fd=LC.inheritedFd('sign'))
+        asyncio.run(self.aioServer.serve())
+
+#--FirmwServ-------------------------------------------------------------------
+    def stopAccept(self, timeout=SERV_DRAIN_TIMEOUT):
+        """ Stop accepting the new connections, the server loop returns(the 
+            asyncio server returns after drain its clients in timeout seconds).
+        """
+        self.terminate = True
+        if self.aioServer: self.aioServer.requestStop(timeout)
+
+#--FirmwServ-------------------------------------------------------------------
+    def listenFds(self):
+        """ Return the listening socket fds: {'sign': fd, 'rg': fd}"""
+        listener = self.aioServer.sock if self.aioServer else \
+            getattr(self.tcpServer, 'server', self.tcpServer)
+        return {'sign': listener.fileno(), 'rg': self.rgThread.sslServer.server.fileno()}
+
+#--FirmwServ-------------------------------------------------------------------
+    def shutdown(self, timeout=SERV_DRAIN_TIMEOUT):
+        """ Drain and stop the server: stop accepting, wait for the in-flight 
+            sessions until timeout(then close them), flush the batched sign 
+            records to the data base and stop the worker threads/processes.
+        """
+        deadline = time.monotonic() + timeout
+        self.stopAccept(timeout)
+        if self.tcpServer: self.tcpServer.close()
+        self.rgThread.stop(timeout)
+        print("Server: draining <%s> connections." %str(len(self.activeConns)))
+        while self.activeConns and time.monotonic() < deadline:
+            time.sleep(0.1)
+        with self.connLock:
+            for conn in self.activeConns:
+                print("Server: close the unfinished connection.")
+                try:
+                    getattr(conn, 'sock_shutdown', conn.shutdown)(socket.SHUT_RDWR)
+                except Exception as e:
+                    print("Server: close connection error, exception: <%s>." %str(e))
+        self.handlerPool.shutdown(wait=True)
+        self.requestPool.shutdown(wait=True)
+        self.rejectPool.shutdown(wait=True)
+        self.rgThread.join(max(0, deadline - time.monotonic()) + 1)
+        # All the requests are finished, flush the pending sign records.
+        self.signBatcher.stop()
+        self.signBatcher.join(SIGN_BATCH_TIMEOUT)
+        self.challPool.stop()
+        self.swattPool.shutdown(wait=False)
+        self.dbMgr.close()
+        print("Server: stopped.")
+
 #-----------------------------------------------------------------------------
 #-----------------------------------------------------------------------------
-class rgCommThread(threading.Thread):
-    """ Thread to open a SSL channel for the sensor registration function.""" 
-    def __init__(self, threadID, name, dbMgr):
-        threading.Thread.__init__(self)
-        self.threadID = threadID
-        self.name = name
-        self.dbMgr = dbMgr  # get the db manager from the server.
-        self.sslServer = SSLS.TLS_sslServer(self)  # init ssl client.
-        self.sslServer.serverSet(port=gv.RGTCP_PORT, listen=1, block=1)
-        self.msgMgr = firmwMsgMgr.msgMgr(self)  # create the message manager.
-        self.terminate = False
-        print("Register:  Thread inited.")
-
-#--rgCommThread----------------------------------------------------------------
-    def run(self):
-        """ main server loop to handle the user's requst. """
-        while not self.terminate:
-            # Add the reconnection handling
+class replySender(object):
+    """ Collect the replies of a connection and send them in the connection
+        thread(the in-flight request threads can not write the SSL connection
+        while the connection thread is reading it).
+    """
+    def __init__(self, conn, timeout=SESSION_TIMEOUT):
+        self.conn = conn
+        self.timeout = timeout  # idle seconds before the connection is closed.
+        self.replies = queue.Queue()
+        # socket pair used to wake up the connection thread for new replies.
+        self.wakeR, self.wakeW = socket.socketpair()
+
+#--replySender-----------------------------------------------------------------
+    def send(self, data):
+        """ Add a reply, it can be called by any thread."""
+        if not data: return
+        self.replies.put(data)
+        self.wakeW.send(b'\0')
+
+#--replySender-----------------------------------------------------------------
+    def flush(self):
+        """ Send all the collected replies."""
+        while True:
             try:
-                conn, addr = self.sslServer.accept()
-                print('RGConnection: connection address:<%s>' %str(addr))
-                while not self.terminate:
-                    data = conn.recv(BUFFER_SIZE)
-                    if not data: break # get the ending message. 
-                    print("RGConnection: received data:<%s>" %str(data))
-                    dataDict = self.msgMgr.loadMsg(data)
-                    if dataDict['act'] == 'CR':
-                        self.handleConnection(conn, dataDict)
-                    elif dataDict['act'] == 'RG':
-                        self.handleRigster(conn, dataDict)
-                    elif dataDict['act'] == 'LO':
-                        self.handleLogout()
-                        break
-                    else:
-                        continue
-            except Exception as e:
-                print("RGConnection: main loop error, exception:<%s>" %str(e))
-                continue
+                data = self.replies.get_nowait()
+            except queue.Empty:
+                return
+            self.conn.sendall(data)
 
-#--rgCommThread----------------------------------------------------------------
-    def handleRigster(self, sender, dataDict):
-        """ Handle the client connection request."""
-        args = (dataDict['signStr'], dataDict['id'],
-                dataDict['type'], dataDict['version'], dataDict['time'])
-        result = self.dbMgr.authorizeSensor(args)
-        reply = self.msgMgr.dumpMsg(action='HB', dataArgs=('RG', result))
-        sender.send(reply)
-#--rgCommThread----------------------------------------------------------------
-    def handleLogout(self):
-        """ Handle user logout: clear all the parameters"""
-        print("RGConnection: sensor logout.")
-
-#--rgCommThread----------------------------------------------------------------
-    def handleConnection(self, sender, dataDict):
-        """ handle the client connection request."""
-        reply = self.msgMgr.dumpMsg(action='HB', dataArgs=('CR', 1))
-        sender.send(reply)
+#--replySender-----------------------------------------------------------------
+    def waitRecv(self):
+        """ Send the replies until the connection has data to read, raise 
+            socket.timeout if the connection is idle for timeout seconds.
+        """
+        while True:
+            self.flush()
+            if self.conn.pending(): return
+            readable, _, _ = select.select([self.conn, self.wakeR], [], [], self.timeout)
+            if not readable: 
+                raise socket.timeout("connection idle for <%s> sec" %str(self.timeout))
+            if self.wakeR in readable: self.wakeR.recv(BUFFER_SIZE)
+            if self.conn in readable: return
+
+#--replySender-----------------------------------------------------------------
+    def close(self):
+        self.wakeR.close()
+        self.wakeW.close()
 
 #-----------------------------------------------------------------------------
 #-----------------------------------------------------------------------------
@@ -340,7 +605,16 @@ class taCommThread(threading.Thread):
 def startServ():
     server = FirmwServ()
     print("Server inited.")
-    server.startServer()
+    LC.servLifecycle(server).run(server.startServer)
+
+def startAioServ():
+    server = FirmwServ(aio=True)
+    print("Asyncio server inited.")
+    LC.servLifecycle(server).run(server.startAioServer)
 
 if __name__ == '__main__':
-    startServ()
+    # Use "python firmwSignServer.py aio" to start the asyncio server mode.
+    if len(sys.argv) > 1 and sys.argv[1] == 'aio':
+        startAioServ()
+    else:
+        startServ()
@@ -0,0 +1,225 @@
+#!/usr/bin/python
+#-----------------------------------------------------------------------------
+# Name:        firmwSwattBench.py
+#
+# Purpose:     This module is used to benchmark the SWATT calculation engines
+#              (python, vectorized, batched and full image) on the
+#              synthetic firmware images and report the ops/sec, p50/p99 
+#              latency, peak traced memory of every case and the process peak
+#              RSS to a json file. The result can be compared
+#              with a saved baseline to find the performance regression of the
+#              attestation path. Every case runs with its own image manager and
+#              KSA cache after the warm-up calculations, the best of the
+#              repeated runs is reported.
+#              usage example:
+#              python firmwSwattBench.py --out bench.json
+#              python firmwSwattBench.py --baseline bench.json --tolerance 0.2
+# Author:      Yuancheng Liu
+#
+# Created:     2019/10/10
+# Copyright:   NUS – Singtel Cyber Security Research & Development Laboratory
+# License:     YC @ NUS
+#-----------------------------------------------------------------------------
+import os
+import sys
+import json
+import time
+import random
+import string
+import argparse
+import tempfile
+import tracemalloc
+import IOT_Att as SWATT
+from firmwImgMgr import firmwImgMgr
+from Constants import SWATT_ITER
+
+try:
+    import resource # not available on Windows.
+except ImportError:
+    resource = None
+
+ENGINES = ('python', 'vectorized', 'batched', 'full')
+
+#-----------------------------------------------------------------------------
+def peakRSS():
+    """ Return the process peak RSS in KB(it never drops, so it is the peak of
+        the whole run), None if it can not be measured.
+    """
+    if resource is None: return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == 'darwin' else rss # bytes on macOS.
+
+#-----------------------------------------------------------------------------
+def percentile(values, pct):
+    """ Return the pct percentile of the values (nearest rank)."""
+    values = sorted(values)
+    idx = max(0, min(len(values)-1, int(round(pct/100.0*len(values)+0.5))-1))
+    return values[idx]
+
+#-----------------------------------------------------------------------------
+def createFirmware(dirPath, size, seed=0):
+    """ Create a synthetic firmware file with the size, return the file path."""
+    filePath = os.path.join(dirPath, "firmware_%d.bin" % size)
+    with open(filePath, 'wb') as fh:
+        fh.write(random.Random(seed).getrandbits(8*size).to_bytes(size, 'little') if size else b'')
+    return filePath
+
+#-----------------------------------------------------------------------------
+def makeChallenges(count, challLen, seed):
+    """ Return count random challenge strings."""
+    rand = random.Random(seed)
+    return [''.join(rand.choice(string.ascii_lowercase) for _ in range(challLen))
+            for _ in range(count)]
+
+#-----------------------------------------------------------------------------
+def runEngine(engine, calculator, challenges, m, filePath, batchSize):
+    """ Run the engine on all the challenges, return the per op latency list.
+        (the batched engine latency is the batch time divided by its size.)
+    """
+    latency = []
+    if engine == 'batched':
+        for idx in range(0, len(challenges), batchSize):
+            batch = challenges[idx:idx+batchSize]
+            t = time.perf_counter()
+            calculator.getSWATTBatch(batch, [SWATT.DE_PUFF]*len(batch), m, filePath)
+            latency.extend([(time.perf_counter()-t)/len(batch)]*len(batch))
+    elif engine == 'full':
+        for challengeStr in challenges:
+            t = time.perf_counter()
+            calculator.getSWATTFull(challengeStr, m, filePath)
+            latency.append(time.perf_counter()-t)
+    else:
+        for challengeStr in challenges:
+            t = time.perf_counter()
+            calculator.getSWATT(challengeStr, m, filePath)
+            latency.append(time.perf_counter()-t)
+    return latency
+
+#-----------------------------------------------------------------------------
+def runCase(engine, filePath, m, iterNum, challLen, count, batchSize, warmup=20, repeat=3):
+    """ Run one benchmark case and return the result dict. Each run uses its
+        own image manager and KSA cache(the result doesn't depend on the cases
+        run before) and does warmup calculations with other challenges before
+        timing, the fastest of the repeat runs is reported. The peak memory
+        is traced in an extra untimed run(tracemalloc slows the engines).
+    """
+    challenges = makeChallenges(count, challLen, 1)
+    warmChallenges = makeChallenges(max(warmup, 1), challLen, 2)
+    best = None
+    for _ in range(max(repeat, 1)):
+        calculator = SWATT.swattCal(vectorized=(engine in ('vectorized', 'batched')),
+                                    imgMgr=firmwImgMgr(), ksaCache=SWATT.ksaCache())
+        calculator.setIterationNum(iterNum)
+        # Load the image and warm up the engine before timing.
+        runEngine(engine, calculator, warmChallenges, m, filePath, batchSize)
+        start = time.perf_counter()
+        latency = runEngine(engine, calculator, challenges, m, filePath, batchSize)
+        total = time.perf_counter()-start
+        if best is None or total < best[0]: best = (total, latency)
+    total, latency = best
+    return {
+        'engine'    : engine,
+        'fwSize'    : os.path.getsize(filePath),
+        'm'         : m,
+        'iterNum'   : iterNum,
+        'challLen'  : challLen,
+        'ops'       : count,
+        'warmup'    : warmup,
+        'repeat'    : repeat,
+        'opsPerSec' : round(count/total, 2),
+        'p50ms'     : round(percentile(latency, 50)*1000, 4),
+        'p99ms'     : round(percentile(latency, 99)*1000, 4),
+        'peakMemKB' : tracePeakMem(engine, filePath, m, iterNum, warmChallenges, batchSize)
+    }
+
+#-----------------------------------------------------------------------------
+def tracePeakMem(engine, filePath, m, iterNum, challenges, batchSize):
+    """ Run the engine with a new calculator(the image is loaded again) and
+        return the peak memory allocated by the run in KB.
+    """
+    tracemalloc.start()
+    try:
+        calculator = SWATT.swattCal(vectorized=(engine in ('vectorized', 'batched')),
+                                    imgMgr=firmwImgMgr(), ksaCache=SWATT.ksaCache())
+        calculator.setIterationNum(iterNum)
+        runEngine(engine, calculator, challenges, m, filePath, batchSize)
+        return tracemalloc.get_traced_memory()[1] // 1024
+    finally:
+        tracemalloc.stop()
+
+#-----------------------------------------------------------------------------
+def caseKey(case):
+    """ Key used to match a result case with the baseline case."""
+    return (case['engine'], case['fwSize'], case['m'], case['iterNum'], case['challLen'])
+
+#-----------------------------------------------------------------------------
+def compareBaseline(results, baseline, tolerance):
+    """ Compare the results ops/sec with the baseline, return the regression
+        case list [(case, baselineOpsPerSec)].
+    """
+    baseDict = {caseKey(case): case for case in baseline['cases']}
+    regressions = []
+    for case in results['cases']:
+        base = baseDict.get(caseKey(case))
+        if base and case['opsPerSec'] < base['opsPerSec']*(1-tolerance):
+            regressions.append((case, base['opsPerSec']))
+    return regressions
+
+#-----------------------------------------------------------------------------
+def parseArgs(argv):
+    parser = argparse.ArgumentParser(description="SWATT engine benchmark.")
+    parser.add_argument('--iters', type=int, nargs='+', default=[SWATT_ITER],
+                        help="SWATT iteration count list (0 means use m).")
+    parser.add_argument('--m', type=int, nargs='+', default=[SWATT_ITER],
+                        help="KSA state size list (must >= 259).")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[64*1024, 620900, 4*1024*1024],
+                        help="Synthetic firmware size list in bytes.")
+    parser.add_argument('--challLens', type=int, nargs='+', default=[10],
+                        help="Challenge string length list.")
+    parser.add_argument('--engines', nargs='+', default=list(ENGINES), choices=ENGINES)
+    parser.add_argument('--count', type=int, default=200, help="SWATT calculation per case.")
+    parser.add_argument('--batchSize', type=int, default=50, help="Batched engine batch size.")
+    parser.add_argument('--warmup', type=int, default=20, help="Warm-up calculations before timing.")
+    parser.add_argument('--repeat', type=int, default=3, help="Timed runs per case, the best is reported.")
+    parser.add_argument('--out', default=None, help="Json file to save the result.")
+    parser.add_argument('--baseline', default=None, help="Baseline json file to compare.")
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help="Allowed ops/sec drop ratio before report regression.")
+    return parser.parse_args(argv)
+
+#-----------------------------------------------------------------------------
+def main(argv=None):
+    args = parseArgs(argv)
+    if SWATT.np is None and set(args.engines) - {'python'}:
+        print("Bench: numpy is not installed, the vectorized engines fall back to python.")
+    results = {'time': time.time(), 'python': sys.version.split()[0], 'cases': []}
+    with tempfile.TemporaryDirectory() as tmpDir:
+        for size in args.sizes:
+            filePath = createFirmware(tmpDir, size)
+            for m in args.m:
+                for iterNum in args.iters:
+                    if iterNum > m: continue
+                    for challLen in args.challLens:
+                        for engine in args.engines:
+                            case = runCase(engine, filePath, m, iterNum, challLen, args.count,
+                                           args.batchSize, args.warmup, args.repeat)
+                            results['cases'].append(case)
+                            print("Bench: %(engine)-10s size=%(fwSize)-8d m=%(m)-5d iter=%(iterNum)-5d "
+                                  "challLen=%(challLen)-3d %(opsPerSec)10.2f ops/s p50=%(p50ms).3fms "
+                                  "p99=%(p99ms).3fms mem=%(peakMemKB)dKB" % case)
+    results['peakRssKB'] = peakRSS()
+    if args.out:
+        with open(args.out, 'w') as fh:
+            json.dump(results, fh, indent=2)
+        print("Bench: result saved in <%s>." % args.out)
+    if args.baseline:
+        with open(args.baseline, 'r') as fh:
+            regressions = compareBaseline(results, json.load(fh), args.tolerance)
+        for case, baseOps in regressions:
+            print("Bench: regression %s: %.2f ops/s (baseline %.2f)" % (str(caseKey(case)), case['opsPerSec'], baseOps))
+        if regressions: return 1
+        print("Bench: no regression compare with the baseline.")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
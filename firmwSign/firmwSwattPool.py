@@ -0,0 +1,136 @@
+#!/usr/bin/python
+#-----------------------------------------------------------------------------
+# Name:        firmwSwattPool.py
+#
+# Purpose:     This module is used to create a SWATT verification worker pool
+#              (process pool) so the servers can calculate the expected SWATT
+#              value without blocking their connection handling thread. The
+#              workers are pre-warmed with the loaded firmware images.
+# Author:      Yuancheng Liu
+#
+# Created:     2019/10/08
+# Copyright:   NUS – Singtel Cyber Security Research & Development Laboratory
+# License:     YC @ NUS
+#-----------------------------------------------------------------------------
+import os
+import asyncio
+import concurrent.futures
+import IOT_Att as SWATT
+from Constants import SWATT_WORKERS, SWATT_TIMEOUT, SWATT_DIGEST
+
+WORKER_CAL = None   # SWATT calculator of the worker process.
+
+#-----------------------------------------------------------------------------
+def initWorker(imagePaths, vectorized, digestVer):
+    """ Worker process initializer: create the calculator and map the images."""
+    global WORKER_CAL
+    WORKER_CAL = SWATT.swattCal(vectorized=vectorized, digestVer=digestVer)
+    for path in imagePaths:
+        SWATT.IMG_MGR.getImage(path)
+
+#-----------------------------------------------------------------------------
+def warmUp():
+    """ Dummy job used to start the worker processes."""
+    return os.getpid()
+
+#-----------------------------------------------------------------------------
+def calSWATT(challengeStr, puff, m, filePath, iterNum):
+    """ Worker job: calculate one file SWATT value."""
+    WORKER_CAL.iterM = 0
+    WORKER_CAL.setIterationNum(iterNum)
+    WORKER_CAL.setPuff(puff)
+    return WORKER_CAL.getSWATT(challengeStr, m, filePath)
+
+#-----------------------------------------------------------------------------
+def calSWATTBatch(challenges, puffs, m, filePath, iterNum):
+    """ Worker job: calculate the SWATT values of a challenge batch."""
+    WORKER_CAL.iterM = 0
+    WORKER_CAL.setIterationNum(iterNum)
+    return WORKER_CAL.getSWATTBatch(challenges, puffs, m, filePath)
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class swattPool(object):
+    """ SWATT verification worker pool. submit()/submitBatch() return a
+        concurrent.futures.Future, getSWATT() waits for the result and
+        getSWATTAsync() can be awaited in an asyncio event loop.
+    """
+    def __init__(self, imagePaths=None, workers=SWATT_WORKERS, timeout=SWATT_TIMEOUT,
+                 vectorized=True, digestVer=SWATT_DIGEST):
+        self.timeout = timeout
+        self.imagePaths = list(imagePaths) if imagePaths else []
+        self.executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers, initializer=initWorker,
+            initargs=(self.imagePaths, vectorized, digestVer))
+        # Start all the workers now so the first request doesn't wait.
+        warmJobs = [self.executor.submit(warmUp) for _ in range(workers)]
+        concurrent.futures.wait(warmJobs)
+        print("SwattPool: <%s> workers started." % str(workers))
+
+#--swattPool-------------------------------------------------------------------
+    def submit(self, challengeStr, puff, m, filePath, iterNum=0):
+        """ Submit one SWATT calculation job, return the job future."""
+        return self.executor.submit(calSWATT, challengeStr, puff, m, filePath, iterNum)
+
+#--swattPool-------------------------------------------------------------------
+    def submitBatch(self, challenges, puffs, m, filePath, iterNum=0):
+        """ Submit a SWATT batch job, return the job future."""
+        return self.executor.submit(calSWATTBatch, list(challenges), list(puffs), m, filePath, iterNum)
+
+#--swattPool-------------------------------------------------------------------
+    def getResult(self, future, timeout=None):
+        """ Wait for the job result, return None if the job is time out or
+            failed.
+        """
+        try:
+            return future.result(timeout=timeout if timeout else self.timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            print("SwattPool: SWATT job time out.")
+        except Exception as e:
+            print("SwattPool: SWATT job failed, exception: <%s>." % str(e))
+        return None
+
+#--swattPool-------------------------------------------------------------------
+    def getSWATT(self, challengeStr, puff, m, filePath, iterNum=0, timeout=None):
+        """ Calculate the SWATT value in the pool and wait for the result."""
+        return self.getResult(self.submit(challengeStr, puff, m, filePath, iterNum), timeout)
+
+#--swattPool-------------------------------------------------------------------
+    async def getSWATTAsync(self, challengeStr, puff, m, filePath, iterNum=0, timeout=None):
+        """ Coroutine version of getSWATT()."""
+        future = self.submit(challengeStr, puff, m, filePath, iterNum)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future),
+                                          timeout if timeout else self.timeout)
+        except asyncio.TimeoutError:
+            print("SwattPool: SWATT job time out.")
+        except Exception as e:
+            print("SwattPool: SWATT job failed, exception: <%s>." % str(e))
+        return None
+
+#--swattPool-------------------------------------------------------------------
+    def shutdown(self, wait=True):
+        """ Stop the worker processes."""
+        self.executor.shutdown(wait=wait)
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+def testCase():
+    firmwarePath = "".join([os.getcwd(), "\\firmwSign\\firmwareSample"])
+    pool = swattPool(imagePaths=[firmwarePath], workers=2)
+    print("Start SWATT pool test.")
+    result = pool.getSWATT("Testing", SWATT.DE_PUFF, 300, firmwarePath)
+    if result == SWATT.swattCal(digestVer=SWATT_DIGEST).getSWATT("Testing", 300, firmwarePath):
+        print("SWATT pool test pass.")
+    else:
+        print("SWATT pool test fail.")
+    result = asyncio.run(pool.getSWATTAsync("Testing", SWATT.DE_PUFF, 300, firmwarePath))
+    if result == pool.getSWATT("Testing", SWATT.DE_PUFF, 300, firmwarePath):
+        print("SWATT pool async test pass.")
+    else:
+        print("SWATT pool async test fail.")
+    pool.shutdown()
+
+if __name__ == '__main__':
+    testCase()
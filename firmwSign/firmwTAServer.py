@@ -13,6 +13,7 @@
 import socket
 import IOT_Att as SWATT
 import firmwMsgMgr
+import firmwSwattPool as SWPOOL
 
 # if got error install Crypto please usethis: 
 #   >> pip install pycryptodome
@@ -29,6 +30,7 @@ from Crypto.Cipher import AES
 LOCAL_BIND_IP   = '0.0.0.0'
 LOCAL_PORT      = 5007
 DEFUALT_CH_LEN  = 7     # default challenge we are going to use. 
+DEFUALT_FW      = "firmwareSample"
 
 # AES parameters:
 DE_BUFFER_SIZE = 32     # defialt AES cipher buffer size.
@@ -67,8 +69,11 @@ class AESCipher:
 #-----------------------------------------------------------------------------
 class firmwTAServer(object):
     
-    def __init__(self):
-        """ init the TCP socket, SWATT calculator and AES cipher."""
+    def __init__(self, swattPool=None):
+        """ init the TCP socket, SWATT calculator and AES cipher. The SWATT 
+            value is verified in the swattPool(a new pool will be created if
+            it is None).
+        """
         try:
             self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.server.bind((LOCAL_BIND_IP, LOCAL_PORT))
@@ -81,6 +86,7 @@ class firmwTAServer(object):
             self.challengeLen = DEFUALT_CH_LEN
             self.swattHd = SWATT.swattCal()
             self.swattHd.setPuff(SWATT.DE_PUFF)
+            self.swattPool = swattPool if swattPool else SWPOOL.swattPool(imagePaths=[DEFUALT_FW])
 
             # Init the message manager
             self.msgMgr= firmwMsgMgr.msgMgr(self) # create the message manager.
@@ -130,16 +136,17 @@ class firmwTAServer(object):
         self.encrypted = self.cipher.encrypt(self.challengeB)
         client_socket.send(self.encrypted)
            
-        self.swattHd.setIterationNum(int(n))
-        # Calcualte the SWATT value for verification.
-        result = self.swattHd.getSWATT(self.challengeStr, int(m), "firmwareSample")
-        result = int(result, 0) # hex string to int.
-        print ('TA_Server:  SWATT result<%s>' % str(result))
+        # Calcualte the SWATT value for verification in the worker pool while
+        # the trust app is calculating.
+        swattJob = self.swattPool.submit(self.challengeStr, SWATT.DE_PUFF, int(m), DEFUALT_FW, iterNum=int(n))
         
         print("-------------")
         print ('TA_Server: Received the SWATT bytes and decode')
         #request = client_socket.recv(32)
         request = client_socket.recv(DE_BUFFER_SIZE)
+        result = self.swattPool.getResult(swattJob)
+        result = SWATT.digestValue(result) if result else None # hex string to int.
+        print ('TA_Server:  SWATT result<%s>' % str(result))
         data = self.cipher.decrypt(request)
         data = str(data).split('x0')[0]
         print('TA_Server: Received the SWATT<%s>' %str(data))
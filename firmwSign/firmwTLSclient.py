@@ -65,7 +65,9 @@ class TLS_sslClient(object):
         if not isinstance(data, bytes):
             print("The send data <%s> has been converted to bytes format." %str(data))
             data = str(data).encode('utf-8')
-        self.sock.send(data)
+        # send() writes at most one TLS record(16KB), a big message frame
+        # would be truncated, send all the data.
+        self.sock.sendall(data)
 
 #--TLS_sslClient---------------------------------------------------------------
     def shutdown(self):
@@ -94,6 +96,42 @@ def testCase():
     sslClient.shutdown()
     sslClient.close()
 
+def testFrameCase():
+    """ Send the message frames bigger than one TLS record(a file frame and a
+        500 entries bulk sign request) through a local TLS server and check 
+        the server gets the whole frames.
+    """
+    import threading
+    import firmwMsgMgr
+    import firmwTLSserver as SSLS
+    print("SSL big message frame test:")
+    sslServer = SSLS.TLS_sslServer(None)
+    sslServer.serverSet(port=LOCAL_IP[1]+1, listen=1, block=1)
+    result = []
+    def serve():
+        conn, _ = sslServer.accept()
+        reader = firmwMsgMgr.frameReader(conn.recv)
+        result.extend([reader.readFrame(), reader.readFrame()])
+        conn.close()
+    server = threading.Thread(target=serve)
+    server.start()
+    frame = firmwMsgMgr.packFrame(b'F' + os.urandom(400000))
+    msgMgr = firmwMsgMgr.msgMgr(None, framing=True)
+    entry = (100, 200, '0x1234', '2019-10-14', 'XKAK_PPL_COUNT', '1.01', os.urandom(256))
+    bulkMsg = msgMgr.dumpMsg(action='SB', dataArgs=[entry]*500, rid=1)
+    sslClient = TLS_sslClient(None)
+    sslClient.connect((LOCAL_IP[0], LOCAL_IP[1]+1))
+    sslClient.send(frame)
+    sslClient.send(bulkMsg)
+    server.join(10)
+    sslClient.close()
+    sslServer.server.close()
+    if len(result) == 2 and result[0] == frame and \
+        len(msgMgr.loadMsg(result[1])['entries']) == 500:
+        print("SSL big message frame test pass.")
+    else:
+        print("SSL big message frame test fail.")
+
 if __name__ == '__main__':
-    pass
+    testFrameCase()
     testCase()
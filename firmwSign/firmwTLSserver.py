@@ -56,14 +56,23 @@ class TLS_sslServer(object):
 #--TLS_sslServer---------------------------------------------------------------
     def close(self):
         """Close the server."""
-        if not self.cli: self.cli.close()
+        if self.cli: self.cli.close()
         self.server.close()
 
 #--TLS_sslServer---------------------------------------------------------------
-    def serverSet(self, port=LOCAL_PORT, listen=LISTEN_NUM, block=1):
-        """ Set up the SSL server. """
-        self.server = SSL.Connection(self.ctx, socket.socket(socket.AF_INET, socket.SOCK_STREAM))
-        self.server.bind(('', int(port)))
+    def serverSet(self, port=LOCAL_PORT, listen=LISTEN_NUM, block=1, fd=None):
+        """ Set up the SSL server. fd: use the listening socket inherited from
+            the old server process(hot restart) instead of binding the port.
+        """
+        if fd is None:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            if os.name != 'nt':
+                # Rebind the port while the old connections are in TIME_WAIT.
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind(('', int(port)))
+        else:
+            sock = socket.socket(fileno=fd)
+        self.server = SSL.Connection(self.ctx, sock)
         self.server.listen(listen)
         self.server.setblocking(block)
 
@@ -99,7 +108,8 @@ class TLS_sslServer(object):
         if not isinstance(data, bytes):
             print("The send data <%s> has been converted to bytes format." %str(data))
             data = str(data).encode('utf-8')
-        self.cli.send(data)
+        # send() writes at most one TLS record(16KB), send all the data.
+        self.cli.sendall(data)
 
 #--TLS_sslServer---------------------------------------------------------------
     def shutdown(self):